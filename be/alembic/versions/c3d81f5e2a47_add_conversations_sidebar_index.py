@@ -0,0 +1,46 @@
+"""add conversations sidebar index
+
+Revision ID: c3d81f5e2a47
+Revises: 9e4f2a6c8b13
+Create Date: 2026-10-18 11:21:05.377410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d81f5e2a47'
+down_revision: Union[str, Sequence[str], None] = '9e4f2a6c8b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # updated_at dùng làm khóa sắp xếp của sidebar nên không được NULL
+    op.execute(
+        "UPDATE conversations SET updated_at = COALESCE("
+        "(SELECT MAX(messages.created_at) FROM messages WHERE messages.conversation_id = conversations.id), "
+        "created_at, now()) "
+        "WHERE updated_at IS NULL"
+    )
+    op.alter_column('conversations', 'updated_at',
+               existing_type=sa.DateTime(timezone=True),
+               server_default=sa.text('now()'),
+               nullable=False)
+    op.create_index('ix_conversations_user_updated_id', 'conversations', ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')], unique=False)
+    # Index composite đã có user_id ở cột đầu, index cũ thừa
+    op.drop_index(op.f('ix_conversations_user_id'), table_name='conversations')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_conversations_user_id'), 'conversations', ['user_id'], unique=False)
+    op.drop_index('ix_conversations_user_updated_id', table_name='conversations')
+    op.alter_column('conversations', 'updated_at',
+               existing_type=sa.DateTime(timezone=True),
+               server_default=None,
+               nullable=True)
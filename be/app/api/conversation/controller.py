@@ -1,25 +1,84 @@
+import os
+import uuid
+from sqlalchemy import select, tuple_, func
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile, HTTPException, status
 from typing import Optional, List
+import asyncio
 
 from .model import Conversation
-from app.core.logging_config import logger
+from app.api.message.model import Message
+from app.core.database import AsyncSessionLocal
+from app.core.logging_config import logger, SAMPLED
+from app.core.pagination import encode_cursor, decode_cursor
 
-from app.api.message.controller import create_message
+from app.api.message.controller import create_message_async, stage_message, get_message_by_id_async
+from app.api.message.schemas import MessageResponse
 from app.api.file.controller import (
-    upload_to_supabase,
-    create_file_record,
-    MAX_FILE_SIZE
+    read_upload,
+    resolve_upload_urls,
+    upload_to_storage,
+    stage_file_records
 )
 
-from app.services.chat_service import process_chat_message
+from app.services.chat_service import process_chat_message, stream_chat_message
+from app.services.context_service import build_context, schedule_compaction
+from app.services.job_queue import job_queue, QueueFull
+from app.services.response_cache import response_cache_enabled, set_response_cache_enabled
+from app.services.message_notifier import message_notifier
+from app.core.metrics import stage
 
 
 def get_conversation_by_id(db: Session, conversation_id):
     return db.query(Conversation).filter(Conversation.id == conversation_id).first()
 
-def get_conversations_by_user(db: Session, user_id):
-    return db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.created_at.desc()).all()
+async def get_conversation_by_id_async(db: AsyncSession, conversation_id):
+    result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
+    return result.scalars().first()
+
+CONVERSATION_PREVIEW_CHARS = int(os.getenv("CONVERSATION_PREVIEW_CHARS", "120"))
+
+async def get_conversation_summaries_async(db: AsyncSession, user_id, *, limit: int, before: str | None = None):
+    # Một query cho cả trang sidebar: keyset trên (user_id, updated_at, id),
+    # message cuối + số message lấy bằng subquery trên index ix_messages_conversation_created_id.
+    # Trả về (rows, has_more)
+    last_message = (
+        select(Message.id)
+        .where(Message.conversation_id == Conversation.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    message_count = (
+        select(func.count())
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+
+    query = (
+        select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.created_at,
+            Conversation.updated_at,
+            message_count.label("message_count"),
+            func.substr(Message.content, 1, CONVERSATION_PREVIEW_CHARS).label("last_message"),
+            Message.sender.label("last_message_sender"),
+            Message.created_at.label("last_message_at"),
+        )
+        .outerjoin(Message, Message.id == last_message)
+        .where(Conversation.user_id == user_id)
+    )
+    if before is not None:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < decode_cursor(before))
+    query = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = result.all()
+    return rows[:limit], len(rows) > limit
 
 
 def create_conversation(db: Session, title: str, user_id):
@@ -27,7 +86,7 @@ def create_conversation(db: Session, title: str, user_id):
     db.add(conversation)
     db.commit()
     db.refresh(conversation)
-    logger.info(f"Created new conversation: {conversation.title} for user_id={user_id}")
+    logger.info("Created new conversation: %s for user_id=%s", conversation.title, user_id)
     return conversation
 
 
@@ -38,7 +97,7 @@ def update_conversation(db: Session, conversation_id, title: str):
     conversation.title = title #type: ignore
     db.commit()
     db.refresh(conversation)
-    logger.info(f"Updated conversation id={conversation_id} title={title}")
+    logger.info("Updated conversation id=%s title=%s", conversation_id, title)
     return conversation
 
 
@@ -48,88 +107,249 @@ def delete_conversation(db: Session, conversation_id):
         return None
     db.delete(conversation)
     db.commit()
-    logger.info(f"Deleted conversation id={conversation_id}")
+    logger.info("Deleted conversation id=%s", conversation_id)
     return True
 
 
 
-async def add_message_to_conversation(
-    db: Session,
+async def _read_files(files: Optional[List[UploadFile]]) -> list:
+    return [await read_upload(file) for file in files or []]
+
+
+async def _save_user_turn(
+    db: AsyncSession,
     user_id: str,
     conversation_id: str,
     content: Optional[str] = None,
     files: Optional[List[UploadFile]] = None,
 ):
-    conversation = get_conversation_by_id(db, conversation_id)
+    conversation = await get_conversation_by_id_async(db, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
+    # build_context đưa lịch sử + summary của hội thoại vào prompt: chỉ chủ hội thoại được gửi tin
+    if conversation.user_id != user_id: #type: ignore
+        logger.warning("Unauthorized access: user_id=%s tried to post to conversation_id=%s", user_id, conversation_id)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+    # Kiểm tra file trước khi ghi gì vào DB
+    uploaded_files = await _read_files(files)
+    await resolve_upload_urls(db, uploaded_files)
+
+    # Lịch sử hội thoại (trước tin nhắn hiện tại) trong giới hạn token
+    context = await build_context(db, conversation, content or "")
+
     message = None
     if content:
-        message = create_message(
+        message = await create_message_async(
             db=db,
             user_id=user_id,
             conversation_id=conversation_id,
             content=content,
             sender="user"
         )
+    else:
+        # Lượt chỉ có file: đóng transaction đọc, không giữ nó mở suốt lúc gọi LLM
+        # (now() của câu trả lời AI sẽ bị lấy theo thời điểm bắt đầu transaction)
+        await db.commit()
 
-    uploaded_files = []
-    if files:
-        for file in files:
-            file.file.seek(0)
-
-            file_bytes = await file.read()
-            file.file.seek(0)
-
-            if not file_bytes:
-                raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
-
-            size = len(file_bytes)
-
-            if size > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"File {file.filename} is too large ({size/1024/1024:.2f}MB). Maximum limit is {MAX_FILE_SIZE/1024/1024:.0f}MB."
-                )
-            ext = file.filename.split('.')[-1].lower() #type: ignore
-            filetype = "image" if ext in ["png", "jpg", "jpeg", "gif"] else "csv"
-
-            fileurl, size = upload_to_supabase(file, filetype)
-
-            create_file_record(
-                db=db,
-                user_id=user_id,
-                conversation_id=conversation_id,
-                message_id=message.id if message else None,
-                filename=file.filename, #type: ignore
-                filetype=filetype,
-                fileurl=fileurl,
-                size=size
-            )
+    return message, uploaded_files, context
 
-            uploaded_files.append({
-                "bytes": file_bytes,
-                "type": filetype,
-                "mime": file.content_type,
-                "filename": file.filename
-            })
 
-    ai_response = await process_chat_message(
-        content=content if content else "",
-        files=uploaded_files
-    )
+def _start_uploads(uploaded_files: list):
+    # Upload song song và chạy cùng lúc với phần gọi LLM
+    return asyncio.gather(*(upload_to_storage(f) for f in uploaded_files))
+
 
-    ai_message = create_message(
-        db=db,
+async def _abort_uploads(upload_task):
+    upload_task.cancel()
+    await asyncio.gather(upload_task, return_exceptions=True)
+
+
+def _stage_uploaded_files(db: AsyncSession, user_id, conversation_id, message_id, uploaded_files: list) -> list:
+    # Bản ghi file chỉ được ghi sau khi upload xong: dedup (resolve_upload_urls) coi mọi bản ghi
+    # là bằng chứng blob đã có trên storage
+    return stage_file_records(
+        db,
         user_id=user_id,
         conversation_id=conversation_id,
-        content=ai_response,
-        sender="system"
+        message_id=message_id,
+        uploads=uploaded_files,
     )
 
-    logger.info(f"Added message and AI replys to conversation id={conversation_id}")
+
+async def _save_reply(db: AsyncSession, user_id, conversation_id, user_message_id, uploaded_files: list, content: str, reply_id=None):
+    # Một transaction cho các bản ghi file (blob đã upload xong) và câu trả lời của AI
+    with stage("create_message"):
+        ai_message = await stage_message(db, user_id, conversation_id, content, sender="system", message_id=reply_id)
+        _stage_uploaded_files(db, user_id, conversation_id, user_message_id, uploaded_files)
+        await db.commit()
+    message_notifier.notify(conversation_id)
+    return ai_message
+
+
+async def add_message_to_conversation(
+    db: AsyncSession,
+    user_id: str,
+    conversation_id: str,
+    content: Optional[str] = None,
+    files: Optional[List[UploadFile]] = None,
+):
+    message, uploaded_files, context = await _save_user_turn(db, user_id, conversation_id, content, files)
+    upload_task = _start_uploads(uploaded_files)
+
+    try:
+        ai_response = await process_chat_message(
+            content=content if content else "",
+            files=uploaded_files,
+            history=context.messages
+        )
+    except BaseException:
+        await _abort_uploads(upload_task)
+        raise
+
+    await upload_task
+    ai_message = await _save_reply(db, user_id, conversation_id, message.id if message else None, uploaded_files, ai_response)
+    schedule_compaction(conversation_id, context.compact_up_to)
+
+    logger.info("Added message and AI replys to conversation id=%s", conversation_id, extra=SAMPLED)
     return {
         "message": message,
         "ai_message": ai_message
-    }
\ No newline at end of file
+    }
+
+
+async def stream_message_to_conversation(
+    db: AsyncSession,
+    user_id: str,
+    conversation_id: str,
+    content: Optional[str] = None,
+    files: Optional[List[UploadFile]] = None,
+):
+    message, uploaded_files, context = await _save_user_turn(db, user_id, conversation_id, content, files)
+    upload_task = _start_uploads(uploaded_files)
+
+    async def reply_stream():
+        parts = []
+        try:
+            async for token in stream_chat_message(
+                content=content if content else "",
+                files=uploaded_files,
+                history=context.messages
+            ):
+                parts.append(token)
+                yield "delta", token
+        except BaseException:
+            await _abort_uploads(upload_task)
+            raise
+
+        await upload_task
+
+        # Chỉ lưu tin nhắn của AI khi stream đã kết thúc
+        ai_message = await _save_reply(
+            db, user_id, conversation_id, message.id if message else None, uploaded_files, "".join(parts)
+        )
+        schedule_compaction(conversation_id, context.compact_up_to)
+        logger.info("Streamed AI reply to conversation id=%s", conversation_id, extra=SAMPLED)
+        yield "done", ai_message
+
+    return {
+        "message": message,
+        "stream": reply_stream()
+    }
+
+
+async def _reply_job(ctx, payload: dict):
+    # Sinh câu trả lời ở background worker, từng token được đẩy tới subscriber của job.
+    # Worker dùng lại task giữa các job nên luôn set lại cờ cache theo request đã tạo job
+    set_response_cache_enabled(payload.get("cache_enabled", True))
+    user_id = uuid.UUID(payload["user_id"])
+    conversation_id = uuid.UUID(payload["conversation_id"])
+    # Câu trả lời lấy id theo job: lần chạy lại sau khi đã commit (lỗi ở bước sau đó)
+    # trả về bản ghi đã có thay vì gọi LLM và ghi thêm một câu trả lời nữa
+    reply_id = uuid.UUID(ctx.job.id)
+    async with AsyncSessionLocal() as db:
+        ai_message = await get_message_by_id_async(db, reply_id)
+    if ai_message is None:
+        uploaded_files = payload["files"]
+        upload_task = _start_uploads(uploaded_files)
+        parts = []
+        try:
+            async for token in stream_chat_message(
+                content=payload["content"],
+                files=uploaded_files,
+                history=payload["history"]
+            ):
+                parts.append(token)
+                ctx.publish("delta", token)
+        except BaseException:
+            await _abort_uploads(upload_task)
+            raise
+
+        await upload_task
+        user_message_id = uuid.UUID(payload["message_id"]) if payload["message_id"] else None
+        async with AsyncSessionLocal() as db:
+            ai_message = await _save_reply(
+                db, user_id, conversation_id, user_message_id, uploaded_files, "".join(parts), reply_id=reply_id
+            )
+        logger.info("Background AI reply saved to conversation id=%s", conversation_id, extra=SAMPLED)
+
+    if payload["compact_up_to"]:
+        schedule_compaction(conversation_id, decode_cursor(payload["compact_up_to"]))
+    return MessageResponse.model_validate(ai_message).model_dump(mode="json")
+
+
+job_queue.register("chat_reply", _reply_job)
+
+
+def _reply_queue_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Reply queue is full, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def enqueue_message_to_conversation(
+    db: AsyncSession,
+    user_id: str,
+    conversation_id: str,
+    content: Optional[str] = None,
+    files: Optional[List[UploadFile]] = None,
+):
+    # Lưu tin nhắn của user rồi trả về ngay; upload file, câu trả lời của AI và bản ghi file
+    # được job ghi trong cùng một transaction như ở đường đồng bộ.
+    # Giữ chỗ trong queue trước khi ghi gì vào DB: queue đầy thì không lưu tin nhắn không có câu trả lời
+    if not job_queue.reserve():
+        raise _reply_queue_busy()
+
+    try:
+        message, uploaded_files, context = await _save_user_turn(db, user_id, conversation_id, content, files)
+    except BaseException:
+        job_queue.release()
+        raise
+
+    try:
+        job = job_queue.enqueue(
+            "chat_reply",
+            {
+                "user_id": str(user_id),
+                "conversation_id": str(conversation_id),
+                "message_id": str(message.id) if message else None,
+                "content": content if content else "",
+                "files": uploaded_files,
+                "history": context.messages,
+                "compact_up_to": encode_cursor(*context.compact_up_to) if context.compact_up_to else None,
+                "cache_enabled": response_cache_enabled(),
+            },
+            owner_id=str(user_id),
+            reserved=True,
+        )
+    except (QueueFull, RuntimeError) as e:
+        # Queue bị dừng / khởi động lại giữa chừng: tin nhắn đã lưu, client gửi lại sau
+        logger.warning("Failed to queue AI reply for conversation_id=%s: %r", conversation_id, e)
+        raise _reply_queue_busy()
+    logger.info("Queued AI reply job id=%s for conversation id=%s", job.id, conversation_id, extra=SAMPLED)
+    return {
+        "message": message,
+        "job": job
+    }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -11,10 +11,24 @@ class Conversation(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     title = Column(String(100), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Rolling summary của các message cũ, tính đến message (summary_until_at, summary_until_id)
+    summary = Column(Text, nullable=True)
+    summary_until_at = Column(DateTime(timezone=True), nullable=True)
+    summary_until_id = Column(UUID(as_uuid=True), nullable=True)
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
-    files = relationship("File", back_populates="conversation", cascade="all, delete-orphan")
\ No newline at end of file
+    files = relationship("File", back_populates="conversation", cascade="all, delete-orphan")
+
+
+# Index cho sidebar: conversation mới cập nhật nhất của user trước
+Index(
+    "ix_conversations_user_updated_id",
+    Conversation.user_id,
+    Conversation.updated_at.desc(),
+    Conversation.id.desc(),
+)
@@ -1,44 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from uuid import UUID
+import os
+import json
 
-from app.core.database import get_db
-from app.core.logging_config import logger
-from app.core.dependencies import get_current_user
+from app.core.database import get_db, get_async_db
+from app.core.logging_config import logger, SAMPLED
+from app.core.dependencies import get_current_principal, response_cache_policy
+from app.core.principal import Principal
+from app.core.pagination import encode_cursor
 
-from .schemas import ConversationCreate, ConversationRead, ConversationUpdate
+from .schemas import ConversationCreate, ConversationRead, ConversationUpdate, ConversationPage
 from .controller import (
     get_conversation_by_id,
-    get_conversations_by_user,
+    get_conversation_summaries_async,
     create_conversation,
     update_conversation,
     delete_conversation,
-    add_message_to_conversation
+    add_message_to_conversation,
+    stream_message_to_conversation,
+    enqueue_message_to_conversation
 )
 from .model import Conversation
-from app.api.user.model import User 
 from app.api.message.schemas import MessageResponse
+from app.api.job.schemas import JobRead
+
+CONVERSATIONS_PAGE_SIZE = int(os.getenv("CONVERSATIONS_PAGE_SIZE", "30"))
+CONVERSATIONS_PAGE_MAX = int(os.getenv("CONVERSATIONS_PAGE_MAX", "100"))
 
 router = APIRouter()
 
-# Get all conversations for current user
-@router.get("/", response_model=List[ConversationRead])
-def list_conversations(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    conversations = get_conversations_by_user(db, current_user.id)
-    logger.info(f"User {current_user.username} fetched {len(conversations)} conversations")
-    return conversations
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Get conversations for current user (sidebar), mới cập nhật nhất trước
+@router.get("/", response_model=ConversationPage)
+async def list_conversations(
+    limit: int = Query(CONVERSATIONS_PAGE_SIZE, ge=1, le=CONVERSATIONS_PAGE_MAX),
+    before: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    try:
+        rows, has_more = await get_conversation_summaries_async(db, current_user.id, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id) if has_more and rows else None
+    logger.info("User %s fetched %s conversations", current_user.username, len(rows), extra=SAMPLED)
+    return ConversationPage(items=rows, has_more=has_more, next_cursor=next_cursor)
 
 # Get conversation by ID
 @router.get("/{conversation_id}", response_model=ConversationRead)
-def get_conversation(conversation_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_conversation(conversation_id: str, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     conversation = get_conversation_by_id(db, conversation_id)
     if not conversation:
-        logger.warning(f"Conversation not found: id={conversation_id}")
+        logger.warning("Conversation not found: id=%s", conversation_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
 
     if conversation.user_id != current_user.id: #type: ignore
-        logger.warning(f"Unauthorized access: user_id={current_user.id} tried to access conversation_id={conversation_id}")
+        logger.warning("Unauthorized access: user_id=%s tried to access conversation_id=%s", current_user.id, conversation_id)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
     return conversation
@@ -48,13 +73,13 @@ def get_conversation(conversation_id: str, db: Session = Depends(get_db), curren
 def create_new_conversation(
     conversation_in: ConversationCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     try:
         conversation = create_conversation(db, conversation_in.title, current_user.id)
         return conversation
     except Exception as e:
-        logger.error(f"Error creating conversation for user_id={current_user.id}: {repr(e)}")
+        logger.error("Error creating conversation for user_id=%s: %r", current_user.id, e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create conversation")
 
 # Update conversation title
@@ -63,7 +88,7 @@ def update_conversation_title(
     conversation_id: str,
     conversation_in: ConversationUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     conversation = get_conversation_by_id(db, conversation_id)
     if not conversation:
@@ -79,7 +104,7 @@ def update_conversation_title(
 def remove_conversation(
     conversation_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     conversation = get_conversation_by_id(db, conversation_id)
     if not conversation:
@@ -93,12 +118,14 @@ def remove_conversation(
 
 
 
-@router.post("/{conversation_id}/messages/", response_model=dict)
+@router.post("/{conversation_id}/messages/", response_model=dict, dependencies=[Depends(response_cache_policy)])
 async def send_message_in_conversation(
-    conversation_id: str,
+    conversation_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    stream: bool = False,
+    background: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     content: Optional[str] = request.query_params.get("content")
     files: Optional[List[UploadFile]] = None
@@ -120,6 +147,27 @@ async def send_message_in_conversation(
         if form_content is not None:
             content = str(form_content)
 
+    if stream:
+        return await _stream_message_response(db, current_user, conversation_id, content, files)
+
+    if background:
+        # Trả về ngay; câu trả lời lấy qua GET /jobs/{job_id} hoặc WebSocket /jobs/{job_id}/ws
+        result = await enqueue_message_to_conversation(
+            db=db,
+            user_id=current_user.id, #type: ignore
+            conversation_id=conversation_id,
+            content=content,
+            files=files
+        )
+        message = result["message"]
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "message": MessageResponse.model_validate(message).model_dump(mode="json") if message else None,
+                "job": JobRead.model_validate(result["job"].to_dict()).model_dump(mode="json"),
+            },
+        )
+
     result = await add_message_to_conversation(
         db=db,
         user_id=current_user.id, #type: ignore
@@ -138,3 +186,40 @@ async def send_message_in_conversation(
         "message": message_data,
         "ai_message": ai_message_data
     }
+
+
+async def _stream_message_response(db: AsyncSession, current_user: Principal, conversation_id: UUID, content, files):
+    result = await stream_message_to_conversation(
+        db=db,
+        user_id=current_user.id, #type: ignore
+        conversation_id=conversation_id,
+        content=content,
+        files=files
+    )
+
+    message = result["message"]
+    message_data = MessageResponse.model_validate(message).model_dump(mode="json") if message else None
+
+    async def event_stream():
+        # Gửi tin nhắn của user trước, sau đó là từng token của AI
+        yield _sse("message", {"message": message_data})
+        try:
+            async for kind, payload in result["stream"]:
+                if kind == "delta":
+                    yield _sse("delta", {"content": payload})
+                else:
+                    ai_message_data = MessageResponse.model_validate(payload).model_dump(mode="json")
+                    yield _sse("done", {"ai_message": ai_message_data})
+        except HTTPException as e:
+            # Header đã gửi nên không đổi được status: báo qua event error (vd. 503 khi CSV pool quá tải)
+            logger.warning("Streaming reply rejected for conversation_id=%s: %s %s", conversation_id, e.status_code, e.detail)
+            yield _sse("error", {"message": e.detail, "status": e.status_code})
+        except Exception as e:
+            logger.error("Streaming reply failed for conversation_id=%s: %r", conversation_id, e)
+            yield _sse("error", {"message": "Failed to generate reply"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime
+from typing import List
 
 class ConversationBase(BaseModel):
     title: str
@@ -19,4 +20,23 @@ class ConversationRead(ConversationBase):
 
     model_config = {
         "from_attributes": True
-    }
\ No newline at end of file
+    }
+
+class ConversationSummary(BaseModel):
+    id: UUID
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    last_message: str | None = None
+    last_message_sender: str | None = None
+    last_message_at: datetime | None = None
+
+    model_config = {
+        "from_attributes": True
+    }
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    has_more: bool
+    next_cursor: str | None = None
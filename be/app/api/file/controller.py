@@ -1,23 +1,21 @@
 import os
-import uuid
-import io
-import pandas as pd
+import hashlib
 from fastapi import UploadFile, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from supabase import create_client, Client
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.file.model import File
+from app.services.csv_analysis import csv_metadata
+from app.services.csv_pool import run_csv_task
+from app.services.storage_service import get_storage
+from app.core.metrics import stage
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET_IMAGES = os.getenv("SUPABASE_BUCKET_IMAGES", "images")
 SUPABASE_BUCKET_CSV = os.getenv("SUPABASE_BUCKET_CSV", "csv")
 MAX_FILE_SIZE = 10 * 1024 * 1024  
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Supabase URL and KEY must be set in environment variables.")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Đọc + hash file theo từng khúc: mỗi bước chỉ chiếm event loop trong thời gian hash một khúc
+UPLOAD_READ_CHUNK = int(os.getenv("UPLOAD_READ_CHUNK", str(1024 * 1024)))
 
 def get_bucket_by_type(filetype: str) -> str:
     if filetype == "image":
@@ -26,64 +24,134 @@ def get_bucket_by_type(filetype: str) -> str:
         return SUPABASE_BUCKET_CSV
     else:
         raise HTTPException(status_code=400, detail="filetype must be 'image' or 'csv'")
-    
-def upload_to_supabase(file: UploadFile, filetype: str) -> tuple[str, int]:
-    content = file.file.read()
-    size = len(content)
 
+def validate_upload(filename: str, size: int) -> str:
     if size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File is too large ({size/1024/1024:.2f}MB). Maximum limit is {MAX_FILE_SIZE/1024/1024:.0f}MB."
         )
 
-    ext = os.path.splitext(file.filename)[1]  # type: ignore
+    ext = os.path.splitext(filename)[1]
 
     if ext not in [".png", ".jpg", ".jpeg", ".csv"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Unsupported file extension: {ext}. Allowed extensions are .png, .jpg, .jpeg, .csv"
         )
+    return ext
+    
+def detect_filetype(filename: str) -> str:
+    ext = filename.split('.')[-1].lower()
+    return "image" if ext in ["png", "jpg", "jpeg", "gif"] else "csv"
 
-    filename = f"{uuid.uuid4()}{ext}"
-    bucket_name = get_bucket_by_type(filetype)
-    path = f"{bucket_name}/{filename}"
-
-    # Upload file lên Supabase
-    supabase.storage.from_(bucket_name).upload(filename, content)
+async def read_upload(file: UploadFile, filetype: str | None = None) -> dict:
+    # Đọc file đúng một lần; kiểm tra, hash, upload và gọi LLM đều dùng chung buffer này
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File {file.filename} is too large ({file.size/1024/1024:.2f}MB). Maximum limit is {MAX_FILE_SIZE/1024/1024:.0f}MB."
+        )
 
-    # Lấy public URL
-    public_url = supabase.storage.from_(bucket_name).get_public_url(filename)
+    await file.seek(0)
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    while chunk := await file.read(UPLOAD_READ_CHUNK):
+        digest.update(chunk)
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            # Không có file.size (client không gửi): dừng đọc ngay khi vượt giới hạn
+            break
 
-    return public_url, size
+    if not size:
+        raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
 
+    validate_upload(file.filename, size) #type: ignore
 
-def parse_csv_metadata(file: UploadFile) -> dict:
-    content = file.file.read()
-    file.file.seek(0)
-    df = pd.read_csv(io.BytesIO(content))
     return {
-        "rows": len(df),
-        "columns": len(df.columns),
-        "column_names": df.columns.tolist()
+        "bytes": chunks[0] if len(chunks) == 1 else b"".join(chunks),
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "type": filetype or detect_filetype(file.filename), #type: ignore
+        "mime": file.content_type,
+        "filename": file.filename
     }
 
+def _storage_name(upload: dict) -> str:
+    # Tên file theo nội dung: mỗi blob chỉ lưu một lần
+    ext = os.path.splitext(upload["filename"])[1]
+    return f"{upload['sha256']}{ext}"
+
+async def resolve_upload_urls(db: AsyncSession, uploads: list):
+    # File trùng nội dung (cùng SHA-256) đã có trên storage thì dùng lại URL cũ, không upload lại
+    # (bản ghi file chỉ được ghi sau khi blob đã upload xong). File mới: URL tính theo tên nội dung
+    if not uploads:
+        return
+    hashes = [upload["sha256"] for upload in uploads]
+    result = await db.execute(
+        select(File.content_hash, File.filetype, File.fileurl)
+        .where(File.content_hash.in_(hashes))
+        .distinct()
+    )
+    existing = {(content_hash, filetype): fileurl for content_hash, filetype, fileurl in result.all()}
+    for upload in uploads:
+        fileurl = existing.get((upload["sha256"], upload["type"]))
+        upload["stored"] = fileurl is not None
+        if fileurl is None:
+            fileurl = await get_storage().public_url(get_bucket_by_type(upload["type"]), _storage_name(upload))
+        upload["fileurl"] = fileurl
+
+async def upload_to_storage(upload: dict) -> tuple[str, int]:
+    if upload.get("stored"):
+        return upload["fileurl"], upload["size"]
 
-def create_file_record(db: Session, *, user_id, conversation_id, message_id, filename, filetype, fileurl, size):
+    bucket_name = get_bucket_by_type(upload["type"])
+    with stage("storage_upload", upload["type"]):
+        public_url = await get_storage().upload(bucket_name, _storage_name(upload), upload["bytes"], upload["mime"])
+    return public_url, upload["size"]
+
+
+async def parse_csv_metadata(content: bytes) -> dict:
+    return await run_csv_task(csv_metadata, content)
+
+
+def get_files_by_conversation(db: Session, conversation_id):
+    return db.query(File).filter(File.conversation_id == conversation_id).order_by(File.uploaded_at.desc()).all()
+
+
+async def create_file_record_async(db: AsyncSession, *, user_id, conversation_id, message_id, filename, filetype, fileurl, size, content_hash=None):
     db_file = File(
         filename=filename,
         filetype=filetype,
         fileurl=fileurl,
         size=size,
+        content_hash=content_hash,
         user_id=user_id,
         conversation_id=conversation_id,
         message_id=message_id,
     )
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+    await db.commit()
     return db_file
 
 
-def get_files_by_conversation(db: Session, conversation_id):
-    return db.query(File).filter(File.conversation_id == conversation_id).order_by(File.uploaded_at.desc()).all()
\ No newline at end of file
+def stage_file_records(db: AsyncSession, *, user_id, conversation_id, message_id, uploads: list) -> list:
+    # Unit of work: chỉ add vào session, caller commit một lần cho cả lượt chat
+    db_files = [
+        File(
+            filename=upload["filename"],
+            filetype=upload["type"],
+            fileurl=upload["fileurl"],
+            size=upload["size"],
+            content_hash=upload["sha256"],
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+        )
+        for upload in uploads
+    ]
+    db.add_all(db_files)
+    return db_files
+
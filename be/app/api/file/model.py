@@ -7,12 +7,15 @@ from app.core.database import Base
 
 class File(Base):
     __tablename__ = "files"
+    # Lấy uploaded_at (server default) qua RETURNING khi INSERT, không cần refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     filename = Column(String, nullable=False)
     filetype = Column(Enum('image', 'csv', name='filetype_enum'), nullable=False)
     fileurl = Column(String, nullable=False)
     size = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
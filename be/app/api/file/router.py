@@ -1,14 +1,19 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
-from app.core.database import get_db
-from app.core.dependencies import get_current_user
+from app.core.database import get_db, get_async_db
+from app.core.dependencies import get_current_principal
+from app.core.principal import Principal
 from app.core.logging_config import logger
 from app.api.file.schemas import FileRead
 from app.api.file.controller import (
-    upload_to_supabase, 
-    create_file_record, 
+    read_upload, 
+    resolve_upload_urls, 
+    upload_to_storage, 
+    create_file_record_async, 
     get_files_by_conversation, 
     parse_csv_metadata
 )
@@ -21,16 +26,22 @@ async def upload_file(
     filetype: str,
     conversation_id: UUID,
     message_id: UUID | None = None,
-    db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     try:
-        fileurl, size = upload_to_supabase(file, filetype)
+        upload = await read_upload(file, filetype)
+        await resolve_upload_urls(db, [upload])
         if filetype == "csv":
-            csv_info = parse_csv_metadata(file)
-            logger.info(f"CSV summary: {csv_info}")
+            (fileurl, size), csv_info = await asyncio.gather(
+                upload_to_storage(upload),
+                parse_csv_metadata(upload["bytes"])
+            )
+            logger.info("CSV summary: %s", csv_info)
+        else:
+            fileurl, size = await upload_to_storage(upload)
 
-        db_file = create_file_record(
+        db_file = await create_file_record_async(
             db=db,
             user_id=current_user.id,  # type: ignore
             conversation_id=conversation_id,
@@ -38,20 +49,21 @@ async def upload_file(
             filename=file.filename,
             filetype=filetype,
             fileurl=fileurl,
-            size=size
+            size=size,
+            content_hash=upload["sha256"]
         )
 
-        logger.info(f"File uploaded to Supabase: {db_file.filename} ({size} bytes)")
+        logger.info("File uploaded to storage: %s (%s bytes)", db_file.filename, size)
         return db_file
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Upload failed: {repr(e)}")
+        logger.error("Upload failed: %r", e)
         raise HTTPException(status_code=500, detail="Internal server error during file upload")
 
 
 @router.get("/conversation/{conversation_id}", response_model=list[FileRead])
-def list_files(conversation_id: UUID, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def list_files(conversation_id: UUID, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     files = get_files_by_conversation(db, conversation_id)
     return files
@@ -18,6 +18,7 @@ class FileRead(FileBase):
     user_id: UUID
     conversation_id: UUID
     message_id: UUID | None = None
+    content_hash: str | None = None
     uploaded_at: datetime
 
     model_config = {
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from typing import List
+
+from app.core.database import AsyncSessionLocal
+from app.core.logging_config import logger
+from app.core.dependencies import get_current_principal, authenticate_principal
+from app.core.principal import Principal
+from app.services.job_queue import job_queue, SUCCEEDED, DEAD
+
+from .schemas import JobRead
+
+router = APIRouter()
+
+
+def _get_owned_job(job_id: str, principal: Principal):
+    job = job_queue.get(job_id)
+    # Job của user khác cũng trả về 404 để không lộ job id
+    if not job or job.owner_id != str(principal.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+# Dead letters (job đã hết lượt retry) của user hiện tại
+@router.get("/dead-letters", response_model=List[JobRead])
+async def list_dead_letters(current_user: Principal = Depends(get_current_principal)):
+    return [job for job in job_queue.dead_letters() if job["owner_id"] == str(current_user.id)]
+
+
+@router.get("/{job_id}", response_model=JobRead)
+async def get_job(job_id: str, current_user: Principal = Depends(get_current_principal)):
+    return _get_owned_job(job_id, current_user).to_dict()
+
+
+@router.websocket("/{job_id}/ws")
+async def job_updates(websocket: WebSocket, job_id: str, token: str = Query(...)):
+    # Trình duyệt không gửi được header Authorization qua WebSocket nên token nằm ở query string
+    try:
+        async with AsyncSessionLocal() as db:
+            principal = await authenticate_principal(token, db)
+        job = _get_owned_job(job_id, principal)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    # Subscribe trước khi gửi trạng thái hiện tại để không bỏ lỡ sự kiện
+    events = job_queue.subscribe(job_id)
+    try:
+        await websocket.send_json({"event": "status", "data": job.to_dict()})
+        finished = job.done
+        while not finished:
+            event, data = await events.get()
+            await websocket.send_json({"event": event, "data": data})
+            finished = event == "status" and data["status"] in (SUCCEEDED, DEAD)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("WebSocket for job id=%s disconnected", job_id)
+    finally:
+        job_queue.unsubscribe(job_id, events)
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+class JobRead(BaseModel):
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    result: dict | None = None
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
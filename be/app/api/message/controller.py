@@ -1,36 +1,81 @@
+import uuid
+from sqlalchemy import select, update, tuple_, func
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .model import Message
-from app.core.logging_config import logger
+from app.api.conversation.model import Conversation
+from app.core.logging_config import logger, SAMPLED
+from app.core.pagination import decode_cursor
+from app.services.message_notifier import message_notifier
+from app.core.metrics import stage
 
-def get_messages_by_conversation(db: Session, conversation_id):
+def _touch_conversation(conversation_id):
+    # Conversation có message mới được đưa lên đầu sidebar (sắp xếp theo updated_at)
     return (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-        .all()
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(updated_at=func.now())
+        .execution_options(synchronize_session=False)
     )
 
 def get_message_by_id(db: Session, message_id):
     return db.query(Message).filter(Message.id == message_id).first()
 
-def create_message(db: Session, user_id, conversation_id, content, sender: str = "user"):
+def delete_message(db: Session, message_id):
+    message = get_message_by_id(db, message_id)
+    if not message:
+        return None
+    db.delete(message)
+    db.commit()
+    logger.info("Deleted message id=%s", message_id)
+    return True
+
+
+async def get_messages_by_conversation_async(db: AsyncSession, conversation_id, *, limit: int, before: str | None = None, after: str | None = None):
+    # Keyset pagination trên (conversation_id, created_at, id), dùng index ix_messages_conversation_created_id.
+    # Mặc định (không có after) lấy N message mới nhất rồi cuộn ngược bằng before.
+    # Trả về (messages theo thứ tự tăng dần, has_more)
+    key = tuple_(Message.created_at, Message.id)
+    query = select(Message).where(Message.conversation_id == conversation_id)
+
+    if after is not None:
+        query = query.where(key > decode_cursor(after)).order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        if before is not None:
+            query = query.where(key < decode_cursor(before))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+
+    result = await db.execute(query.limit(limit + 1))
+    messages = list(result.scalars().all())
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+    return messages, has_more
+
+async def get_message_by_id_async(db: AsyncSession, message_id):
+    result = await db.execute(select(Message).where(Message.id == message_id))
+    return result.scalars().first()
+
+async def stage_message(db: AsyncSession, user_id, conversation_id, content, sender: str = "user", message_id=None):
+    # Unit of work: caller tự commit. UPDATE chạy trước db.add để các INSERT của lượt chat
+    # được flush chung một lần khi commit; id gán sẵn để bản ghi file tham chiếu được
+    # (message_id: caller tự chọn id, ví dụ để job chạy lại không ghi trùng câu trả lời)
+    await db.execute(_touch_conversation(conversation_id))
     message = Message(
+        id=message_id or uuid.uuid4(),
         user_id=user_id,
         conversation_id=conversation_id,
         content=content,
         sender=sender,
     )
     db.add(message)
-    db.commit()
-    db.refresh(message)
-    logger.info(f"New message created by user_id={user_id} in conversation_id={conversation_id}")
     return message
 
-def delete_message(db: Session, message_id):
-    message = get_message_by_id(db, message_id)
-    if not message:
-        return None
-    db.delete(message)
-    db.commit()
-    logger.info(f"Deleted message id={message_id}")
-    return True
+async def create_message_async(db: AsyncSession, user_id, conversation_id, content, sender: str = "user"):
+    with stage("create_message"):
+        message = await stage_message(db, user_id, conversation_id, content, sender)
+        await db.commit()
+    message_notifier.notify(conversation_id)
+    logger.info("New message created by user_id=%s in conversation_id=%s", user_id, conversation_id, extra=SAMPLED)
+    return message
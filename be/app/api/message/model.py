@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -7,6 +7,12 @@ from app.core.database import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    # Lấy created_at (server default) qua RETURNING khi INSERT, không cần refresh
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # Index cho keyset pagination lịch sử chat
+        Index("ix_messages_conversation_created_id", "conversation_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     content = Column(String, nullable=False)
@@ -15,7 +21,7 @@ class Message(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True)
+    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
 
     user = relationship("User", back_populates="messages")
     conversation = relationship("Conversation", back_populates="messages")
@@ -1,66 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+import os
+import asyncio
 from uuid import UUID
 
-from app.core.database import get_db
-from app.core.logging_config import logger
-from app.core.dependencies import get_current_user
+from app.core.database import get_db, get_async_db
+from app.core.logging_config import logger, SAMPLED
+from app.core.dependencies import get_current_principal
+from app.core.principal import Principal
+from app.core.pagination import encode_cursor, decode_cursor
+from app.services.message_notifier import message_notifier
 
-from .schemas import MessageCreate, MessageRead
+from .schemas import MessageCreate, MessageRead, MessagePage, MessageDelta
 from .controller import (
-    get_messages_by_conversation,
+    get_messages_by_conversation_async,
     get_message_by_id,
-    create_message,
+    create_message_async,
     delete_message
 )
 from .model import Message
-from app.api.user.model import User
-from app.api.conversation.controller import get_conversation_by_id
+from app.api.conversation.controller import get_conversation_by_id_async
+
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+MESSAGES_PAGE_MAX = int(os.getenv("MESSAGES_PAGE_MAX", "200"))
+# Thời gian tối đa một request /since được giữ lại chờ message mới (giây)
+MESSAGES_LONG_POLL_MAX = float(os.getenv("MESSAGES_LONG_POLL_MAX", "30"))
 
 router = APIRouter()
 
-@router.get("/conversation/{conversation_id}", response_model=List[MessageRead])
-def list_messages(
-    conversation_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    conversation = get_conversation_by_id(db, conversation_id)
+
+async def _check_conversation_access(db: AsyncSession, conversation_id, current_user: Principal):
+    conversation = await get_conversation_by_id_async(db, conversation_id)
     if not conversation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
     if conversation.user_id != current_user.id: #type: ignore
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
-    messages = get_messages_by_conversation(db, conversation_id)
-    logger.info(f"User {current_user.username} fetched {len(messages)} messages from conversation_id={conversation_id}")
-    return messages
+
+@router.get("/conversation/{conversation_id}", response_model=MessagePage)
+async def list_messages(
+    conversation_id: UUID,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_PAGE_MAX),
+    before: str | None = None,
+    after: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or after, not both")
+
+    await _check_conversation_access(db, conversation_id, current_user)
+
+    try:
+        messages, has_more = await get_messages_by_conversation_async(
+            db, conversation_id, limit=limit, before=before, after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    next_cursor = None
+    if has_more and messages:
+        # Cuộn ngược: cursor là message cũ nhất; đi tiếp (after): cursor là message mới nhất
+        edge = messages[-1] if after else messages[0]
+        next_cursor = encode_cursor(edge.created_at, edge.id)
+
+    last_cursor = encode_cursor(messages[-1].created_at, messages[-1].id) if messages else None
+
+    logger.info("User %s fetched %s messages from conversation_id=%s", current_user.username, len(messages), conversation_id, extra=SAMPLED)
+    return MessagePage(items=messages, has_more=has_more, next_cursor=next_cursor, last_cursor=last_cursor)
+
+
+@router.get("/conversation/{conversation_id}/since", response_model=MessageDelta)
+async def list_messages_since(
+    conversation_id: UUID,
+    after: str,
+    wait: float = Query(0, ge=0, le=MESSAGES_LONG_POLL_MAX),
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_PAGE_MAX),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    # Chỉ trả về message sau cursor; wait > 0 thì giữ request (long-poll) đến khi có message mới hoặc hết giờ
+    try:
+        decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    await _check_conversation_access(db, conversation_id, current_user)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        waiter = message_notifier.subscribe(conversation_id)
+        try:
+            messages, has_more = await get_messages_by_conversation_async(db, conversation_id, limit=limit, after=after)
+            remaining = deadline - loop.time()
+            if messages or remaining <= 0:
+                break
+            # Trả connection về pool trong lúc chờ
+            await db.rollback()
+            if not await message_notifier.wait(waiter, remaining):
+                break
+        finally:
+            message_notifier.unsubscribe(conversation_id, waiter)
+
+    cursor = encode_cursor(messages[-1].created_at, messages[-1].id) if messages else after
+    return MessageDelta(items=messages, has_more=has_more, cursor=cursor)
 
 
 @router.post("/", response_model=MessageRead)
-def create_new_message(
+async def create_new_message(
     message_in: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    conversation = get_conversation_by_id(db, message_in.conversation_id)
-    if not conversation:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
-    if conversation.user_id != current_user.id: #type: ignore
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    await _check_conversation_access(db, message_in.conversation_id, current_user)
 
     try:
-        message = create_message(
+        message = await create_message_async(
             db,
             user_id=current_user.id,
             conversation_id=message_in.conversation_id,
             content=message_in.content,
             sender="user"
         )
-        logger.info(f"Message created by user={current_user.username} in conversation_id={message_in.conversation_id}")
+        logger.info("Message created by user=%s in conversation_id=%s", current_user.username, message_in.conversation_id)
         return message
     except Exception as e:
-        logger.error(f"Error creating message: {repr(e)}")
+        logger.error("Error creating message: %r", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create message")
 
 
@@ -69,7 +136,7 @@ def create_new_message(
 def remove_message(
     message_id: UUID,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     message = get_message_by_id(db, message_id)
     if not message:
@@ -78,5 +145,5 @@ def remove_message(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
     delete_message(db, message_id)
-    logger.info(f"Message id={message_id} deleted by user={current_user.username}")
+    logger.info("Message id=%s deleted by user=%s", message_id, current_user.username)
     return None
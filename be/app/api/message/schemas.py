@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime
+from typing import List
 
 class MessageBase(BaseModel):
     content: str
@@ -31,4 +32,17 @@ class MessageResponse(BaseModel):
 
     model_config = {
         "from_attributes": True
-    }
\ No newline at end of file
+    }
+class MessagePage(BaseModel):
+    items: List[MessageRead]
+    has_more: bool
+    # Truyền lại qua cùng tham số (before hoặc after) để lấy trang kế tiếp
+    next_cursor: str | None = None
+    # Vị trí message mới nhất trong trang, dùng cho /since
+    last_cursor: str | None = None
+
+class MessageDelta(BaseModel):
+    items: List[MessageRead]
+    has_more: bool
+    # Luôn trả về: truyền lại cho lần gọi /since tiếp theo
+    cursor: str
@@ -1,20 +1,49 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .model import User
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash, verify_and_update_password
+from app.core.logging_config import logger
+from app.core.principal import principal_cache
+from app.services.hash_pool import run_hash_task
 
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
 def create_user(db: Session, username: str, password: str):
     hashed_password = get_password_hash(password)
     db_user = User(username=username, password_hash=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    principal_cache.invalidate(db_user.username)
     return db_user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.password_hash):
+
+async def create_user_async(db: AsyncSession, username: str, password: str):
+    hashed_password = await run_hash_task(get_password_hash, password)
+    db_user = User(username=username, password_hash=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    principal_cache.invalidate(db_user.username)
+    return db_user
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username_async(db, username)
+    if not user:
+        return None
+    valid, new_hash = await run_hash_task(verify_and_update_password, password, user.password_hash)
+    if not valid:
         return None
-    return user
\ No newline at end of file
+    if new_hash:
+        # Hash cũ (cost khác BCRYPT_ROUNDS): lưu lại hash mới
+        user.password_hash = new_hash  # type: ignore
+        await db.commit()
+        principal_cache.invalidate(user.username)
+        logger.info("Password hash upgraded for user: %s", user.username)
+    return user
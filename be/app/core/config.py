@@ -14,5 +14,15 @@ if DB_PASSWORD:
     DB_PASSWORD = urllib.parse.quote_plus(DB_PASSWORD)
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Ghi đè bằng một URL đầy đủ (vd. Postgres local hoặc sqlite:///bench.db khi chạy benchmark)
+if os.getenv('DATABASE_URL'):
+    DATABASE_URL = os.environ['DATABASE_URL']
+    ASYNC_DATABASE_URL = (
+        DATABASE_URL
+        .replace("postgresql://", "postgresql+asyncpg://", 1)
+        .replace("sqlite://", "sqlite+aiosqlite://", 1)
+    )
 
 SECRET_KEY = os.getenv('SECRET_KEY')
\ No newline at end of file
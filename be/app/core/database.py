@@ -1,21 +1,86 @@
+import time
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
-from .config import DATABASE_URL
+from .config import DATABASE_URL, ASYNC_DATABASE_URL
+from .metrics import db_pool_checkout, register_stats
+
+
+class _TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    # Đo thời gian chờ lấy connection (pool hết connection thì request phải xếp hàng ở đây)
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout.labels().observe(time.perf_counter() - start)
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=1800,        
-    pool_size=10,       
-    max_overflow=5 
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Engine được tạo trong lifespan (init_engines), không phải lúc import: import app không cần
+# cấu hình DB hay driver (alembic / script chỉ dùng Base, models)
+engine = None
+async_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+def init_engines():
+    global engine, async_engine
+    if async_engine is not None:
+        return
+
+    # SQLite (benchmark / local): connection được dùng qua nhiều thread của threadpool
+    connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args=connect_args,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_size=10,
+        max_overflow=5
+    )
+    SessionLocal.configure(bind=engine)
+
+    # Async engine dùng cho các handler async (không block event loop)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=_TimedAsyncQueuePool,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_size=10,
+        max_overflow=5
+    )
+    AsyncSessionLocal.configure(bind=async_engine)
+
+async def dispose_engines():
+    # Đóng các connection trong pool; engine vẫn dùng lại được nếu app khởi động lại
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
+def _pool_stats() -> dict:
+    if async_engine is None:
+        return {}
+    pool = async_engine.sync_engine.pool
+    return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()}  # type: ignore
+
+register_stats("db_pool", _pool_stats)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
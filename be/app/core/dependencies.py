@@ -1,14 +1,18 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import get_db
+from .database import get_db, get_async_db
 from .security import SECRET_KEY, ALGORITHM, decode_access_token
 from .logging_config import logger
+from .principal import Principal, principal_cache
+from .metrics import stage
 
+from app.services.response_cache import set_response_cache_enabled
 from app.api.user.model import User
-from app.api.user.controller import get_user_by_username
+from app.api.user.controller import get_user_by_username, get_user_by_username_async
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -30,9 +34,59 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
-        logger.info(f"Authenticated user: {user.username}")
+        logger.debug("Authenticated user: %s", user.username)
         return user
 
     except JWTError as e:
-        logger.warning(f"Invalid token: {repr(e)}")
+        logger.warning("Invalid token: %r", e)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+
+
+def _token_subject(token: str) -> str:
+    try:
+        if SECRET_KEY is None:
+            raise ValueError("SECRET_KEY is not set in the environment variables")
+        payload = decode_access_token(token)
+    except JWTError as e:
+        logger.warning("Invalid token: %r", e)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+
+    if payload is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    return username
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    # Như get_current_user nhưng không load ORM User: JWT vẫn được verify mỗi request,
+    # còn (id, username) được cache theo subject để bỏ query DB
+    with stage("auth"):
+        return await authenticate_principal(token, db)
+
+
+async def authenticate_principal(token: str, db: AsyncSession) -> Principal:
+    # Dùng trực tiếp cho WebSocket (token gửi qua query string)
+    username = _token_subject(token)
+
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    user = await get_user_by_username_async(db, username)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    principal = Principal(id=user.id, username=user.username)  # type: ignore
+    principal_cache.put(username, principal)
+    logger.debug("Authenticated user: %s", principal.username)
+    return principal
+
+
+async def response_cache_policy(request: Request):
+    # Client gửi "Cache-Control: no-cache" / "no-store" để bỏ qua cache câu trả lời của LLM
+    cache_control = request.headers.get("cache-control", "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        set_response_cache_enabled(False)
+
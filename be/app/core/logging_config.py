@@ -1,29 +1,145 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-LOG_DIR = "logs"
+from .metrics import current_request_id
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
 LOG_FILE = "app.log"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (mặc định) hoặc "text" (dễ đọc khi dev)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_TO_FILE = os.getenv("LOG_TO_FILE", "true").lower() == "true"
+# Tỉ lệ giữ lại các log INFO tần suất cao (gắn extra={"sample": True}); WARNING trở lên luôn được ghi
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Queue đầy thì bỏ log thay vì chặn request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
-os.makedirs(LOG_DIR, exist_ok=True)
 LOG_PATH = os.path.join(LOG_DIR, LOG_FILE)
 
-logger = logging.getLogger("app_logger")
-logger.setLevel(logging.INFO)
+# Dùng cho các log INFO lặp lại ở mỗi request: logger.info(..., extra=SAMPLED)
+SAMPLED = {"sample": True}
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
+# Các thuộc tính có sẵn của LogRecord, phần còn lại (truyền qua extra=) là field của log JSON
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "sample"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sample", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class RequestIdFilter(logging.Filter):
+    # Gắn request id (do middleware gán) vào mọi log trong request
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = current_request_id()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Không format ở đây: ghép message / format JSON do thread của listener làm.
+        # Chỉ chuyển traceback thành chuỗi để không giữ frame của request
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
-file_handler = RotatingFileHandler(LOG_PATH, maxBytes=5*1024*1024, backupCount=5)
-file_handler.setLevel(logging.INFO)
 
-formatter = logging.Formatter(
-    fmt="%(asctime)s - [%(levelname)s] - %(name)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+def _build_formatter() -> logging.Formatter:
+    if LOG_FORMAT == "text":
+        return logging.Formatter(
+            fmt="%(asctime)s - [%(levelname)s] - %(name)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+    return JsonFormatter()
+
+
+formatter = _build_formatter()
+
+console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
+handlers = [console_handler]
+
+if LOG_TO_FILE:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    file_handler = RotatingFileHandler(LOG_PATH, maxBytes=5*1024*1024, backupCount=5)
+    file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
+
+# Request chỉ đẩy record vào queue; ghi console / file ở thread nền
+_log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = _NonBlockingQueueHandler(_log_queue)
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+queue_handler.addFilter(RequestIdFilter())
+_listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+
+logger = logging.getLogger("app_logger")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+logger.addHandler(queue_handler)
+_listener.start()
+
+
+def stop_logging():
+    # Ghi nốt các log còn trong queue rồi dừng thread
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def logging_stats() -> dict:
+    return {
+        "queue_depth": _log_queue.qsize(),
+        "queue_size": LOG_QUEUE_SIZE,
+        "dropped": queue_handler.dropped,
+        "sample_rate": LOG_SAMPLE_RATE,
+    }
+
 
-if not logger.hasHandlers():
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+atexit.register(stop_logging)
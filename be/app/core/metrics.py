@@ -0,0 +1,236 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Đơn vị giây; từ vài ms (cache, DB) tới vài chục giây (LLM)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: list = []
+_collectors: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        # Child theo bộ giá trị label, tạo một lần rồi dùng lại (không cấp phát trên hot path)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: tuple, child) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # Đếm theo từng bucket (không cộng dồn), chỉ cộng dồn khi render
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values: tuple, child) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {child.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+def register_stats(component: str, stats_fn):
+    # Xuất các số liệu stats() sẵn có (pool, cache, queue) thành gauge app_<component>_<key>, tính lúc scrape
+    _collectors.append((component, stats_fn))
+
+
+def _render_collectors() -> list:
+    lines = []
+    for component, stats_fn in _collectors:
+        try:
+            stats = stats_fn()
+        except Exception:
+            continue
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"app_{component}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(_render_collectors())
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = Counter("app_http_requests_total", "HTTP requests", ("route", "method", "status"))
+http_request_duration = Histogram("app_http_request_duration_seconds", "HTTP request latency", ("route", "method"))
+http_requests_in_flight = Gauge("app_http_requests_in_flight", "HTTP requests being processed")
+stage_duration = Histogram(
+    "app_stage_duration_seconds", "Time spent in each stage of the chat pipeline", ("stage", "route", "filetype")
+)
+llm_tokens_total = Counter("app_llm_tokens_total", "LLM tokens", ("route", "filetype", "kind"))
+db_pool_checkout = Histogram(
+    "app_db_pool_checkout_seconds", "Time waiting for a DB connection from the pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class RequestMetrics:
+    # Các stage của một request, để gắn label route và cho header Server-Timing
+    __slots__ = ("scope", "stages", "request_id")
+
+    def __init__(self, scope: dict, request_id: str | None = None):
+        self.scope = scope
+        self.stages: dict = {}
+        self.request_id = request_id
+
+    @property
+    def route(self) -> str:
+        # Route template (vd. /messages/conversation/{conversation_id}) để label không bị bùng nổ
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+
+_current_request: ContextVar[RequestMetrics | None] = ContextVar("metrics_request", default=None)
+_current_filetype: ContextVar[str] = ContextVar("metrics_filetype", default="text")
+
+
+def begin_request(scope: dict, request_id: str | None = None) -> RequestMetrics:
+    request_metrics = RequestMetrics(scope, request_id)
+    _current_request.set(request_metrics)
+    return request_metrics
+
+
+def current_request_id() -> str | None:
+    request_metrics = _current_request.get()
+    return request_metrics.request_id if request_metrics is not None else None
+
+
+def set_filetype(filetype: str):
+    # Gọi trong task xử lý một file: các stage bên trong (LLM, ...) được gắn label filetype
+    _current_filetype.set(filetype or "text")
+
+
+def observe_stage(name: str, seconds: float, filetype: str | None = None):
+    if not METRICS_ENABLED:
+        return
+    request_metrics = _current_request.get()
+    route = request_metrics.route if request_metrics is not None else "background"
+    stage_duration.labels(name, route, filetype or _current_filetype.get()).observe(seconds)
+    if request_metrics is not None:
+        request_metrics.stages[name] = request_metrics.stages.get(name, 0.0) + seconds
+
+
+def count_tokens(kind: str, amount: int):
+    if not METRICS_ENABLED or not amount:
+        return
+    request_metrics = _current_request.get()
+    route = request_metrics.route if request_metrics is not None else "background"
+    llm_tokens_total.labels(route, _current_filetype.get(), kind).inc(amount)
+
+
+class stage:
+    # with stage("llm"): ...  — dùng được quanh code sync lẫn await
+    __slots__ = ("name", "filetype", "start")
+
+    def __init__(self, name: str, filetype: str | None = None):
+        self.name = name
+        self.filetype = filetype
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.name, time.perf_counter() - self.start, self.filetype)
+        return False
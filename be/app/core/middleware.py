@@ -1,36 +1,86 @@
-from fastapi import Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-import traceback
 import time
+import uuid
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
 
-from .logging_config import logger
+from .logging_config import logger, SAMPLED
+from .metrics import begin_request, http_requests_in_flight, http_requests_total, http_request_duration
 
-class ErrorLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        try:
-            response = await call_next(request)
-            process_time = (time.time() - start_time) * 1000
+REQUEST_ID_HEADER = "x-request-id"
+
+
+def _record_request(request_metrics, method: str, status_code: int, process_time: float):
+    route = request_metrics.route
+    http_requests_total.labels(route, method, str(status_code)).inc()
+    http_request_duration.labels(route, method).observe(process_time / 1000)
+
+
+def _request_id(scope) -> str:
+    # Dùng lại id từ proxy / client nếu hợp lệ, không thì tạo mới
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            request_id = value.decode("latin-1")
+            if 0 < len(request_id) <= 128 and request_id.isprintable():
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+def _server_timing(request_metrics, start_time: float) -> str:
+    # Các stage đã xong khi gửi header; với response streaming, phần sinh body không nằm trong header này
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in request_metrics.stages.items()]
+    parts.append(f"total;dur={(time.perf_counter() - start_time) * 1000:.1f}")
+    return ", ".join(parts)
 
-            logger.info(
-                f"{request.method} {request.url.path} "
-                f"completed_in={process_time:.2f}ms "
-                f"status={response.status_code}"
-            )
 
-            return response
+class ErrorLoggingMiddleware:
+    # ASGI thuần: không bọc request / response như BaseHTTPMiddleware, body streaming đi thẳng qua
+    def __init__(self, app):
+        self.app = app
 
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        request_id = _request_id(scope)
+        scope.setdefault("state", {})["request_id"] = request_id
+        request_metrics = begin_request(scope, request_id)
+        status_code = 500
+        response_started = False
+
+        async def send_with_headers(message):
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_started = True
+                headers = MutableHeaders(scope=message)
+                headers.append(REQUEST_ID_HEADER, request_id)
+                headers.append("server-timing", _server_timing(request_metrics, start_time))
+            await send(message)
+
+        method = scope["method"]
+        path = scope["path"]
+        http_requests_in_flight.labels().inc()
+        try:
+            await self.app(scope, receive, send_with_headers)
         except Exception as e:
-            process_time = (time.time() - start_time) * 1000
-            error_trace = traceback.format_exc()
+            process_time = (time.perf_counter() - start_time) * 1000
 
             logger.error(
-                f"Exception during {request.method} {request.url.path} "
-                f"({process_time:.2f}ms): {repr(e)}\n{error_trace}"
+                "Exception during %s %s (%.2fms): %r",
+                method, path, process_time, e,
+                exc_info=True,
+                extra={"method": method, "path": path, "duration_ms": round(process_time, 2)},
             )
 
-            return JSONResponse(
+            # Đã gửi header (đang stream) thì không thể trả JSON nữa: để server đóng kết nối
+            if response_started:
+                status_code = 500
+                raise
+
+            response = JSONResponse(
                 status_code=500,
                 content={
                     "success": False,
@@ -38,3 +88,22 @@ class ErrorLoggingMiddleware(BaseHTTPMiddleware):
                     "message": str(e),
                 },
             )
+            await response(scope, receive, send_with_headers)
+        finally:
+            http_requests_in_flight.labels().dec()
+
+            # Tính cả thời gian stream body
+            process_time = (time.perf_counter() - start_time) * 1000
+            _record_request(request_metrics, method, status_code, process_time)
+
+            logger.info(
+                "%s %s completed_in=%.2fms status=%s",
+                method, path, process_time, status_code,
+                extra={
+                    **SAMPLED,
+                    "method": method,
+                    "path": path,
+                    "status": status_code,
+                    "duration_ms": round(process_time, 2),
+                },
+            )
@@ -0,0 +1,17 @@
+import uuid
+import base64
+from datetime import datetime
+
+
+def encode_cursor(ts: datetime, row_id) -> str:
+    # Cursor = (timestamp, id) của bản ghi, mã hóa base64 để client coi như chuỗi opaque
+    raw = f"{ts.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        ts, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(ts), uuid.UUID(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
@@ -0,0 +1,58 @@
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from uuid import UUID
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+
+
+class Principal(NamedTuple):
+    # Thông tin tối thiểu của user đã đăng nhập, đủ cho các handler chỉ cần id / username
+    id: UUID
+    username: str
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[Principal, float]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, subject: str) -> Principal | None:
+        entry = self._entries.get(subject)
+        if entry is not None:
+            principal, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(subject)
+                self.hits += 1
+                return principal
+            del self._entries[subject]
+        self.misses += 1
+        return None
+
+    def put(self, subject: str, principal: Principal):
+        if self.ttl <= 0:
+            return
+        self._entries[subject] = (principal, time.monotonic() + self.ttl)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        # Gọi sau mọi thay đổi user / thông tin đăng nhập (tạo user, đổi hash mật khẩu,
+        # đổi tên / xóa / khóa) để request sau đọc lại từ DB
+        self._entries.pop(subject, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX_SIZE)
@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -7,11 +8,18 @@ from .config import SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Đổi BCRYPT_ROUNDS thì hash cũ sẽ được hash lại khi user đăng nhập (xem verify_and_update_password)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    # Trả về (hợp lệ, hash mới hoặc None nếu hash hiện tại vẫn đúng cấu hình)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -0,0 +1,71 @@
+import sys
+import time
+
+from .logging_config import logger
+
+# Các module nặng không nên bị import lúc khởi động (pandas chỉ chạy trong worker CSV, ...)
+HEAVY_MODULES = ("pandas", "numpy", "PIL", "openai", "supabase")
+
+
+def _rss_mb() -> float | None:
+    # Linux; nền tảng khác không có /proc thì bỏ qua
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class StartupReport:
+    # Thời gian import app và từng bước trong lifespan, log một dòng khi server sẵn sàng
+    def __init__(self):
+        self.import_seconds = 0.0
+        self.steps: dict = {}
+        self.rss_mb = None
+
+    def begin(self, import_seconds: float):
+        self.import_seconds = import_seconds
+        self.steps = {}
+        self.rss_mb = None
+
+    def step(self, name: str):
+        return _Step(self, name)
+
+    def finish(self):
+        self.rss_mb = _rss_mb()
+        steps = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.steps.items())
+        heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+        logger.info(
+            "Startup: import=%.0fms %s ready=%.0fms rss=%sMB heavy_modules=%s",
+            self.import_seconds * 1000, steps, (self.import_seconds + sum(self.steps.values())) * 1000,
+            self.rss_mb, ",".join(heavy) or "-",
+        )
+
+    def stats(self) -> dict:
+        return {
+            "import_seconds": round(self.import_seconds, 4),
+            "lifespan_seconds": round(sum(self.steps.values()), 4),
+            "rss_mb": self.rss_mb,
+        }
+
+
+class _Step:
+    __slots__ = ("report", "name", "start")
+
+    def __init__(self, report: StartupReport, name: str):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.steps[self.name] = time.perf_counter() - self.start
+        return False
+
+
+startup_report = StartupReport()
@@ -1,35 +1,109 @@
+import time
+
+_import_started = time.perf_counter()
+
+# Nạp .env một lần, trước mọi module đọc os.getenv lúc import
+from app.core import config  # noqa: F401,E402
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
 from app.core.middleware import ErrorLoggingMiddleware
-from app.core.logging_config import logger
+from app.core.logging_config import logger, SAMPLED, logging_stats
+from app.core.metrics import render_metrics, register_stats
+from app.core.principal import principal_cache
+from app.core.database import init_engines, dispose_engines
+from app.core.startup import startup_report
 
 from app.api.auth.router import router as auth_router
 from app.api.user.router import router as user_router
 from app.api.conversation.router import router as conversation_router
 from app.api.file.router import router as file_router
 from app.api.message.router import router as message_router
+from app.api.job.router import router as job_router
+
+from app.services.llm_client import open_client, close_client
+from app.services.csv_pool import start_csv_pool, shutdown_csv_pool, csv_pool_stats
+from app.services.csv_cache import summary_cache
+from app.services.storage_service import open_storage, close_storage
+from app.services.hash_pool import shutdown_hash_pool, hash_pool_stats
+from app.services.context_service import warm_tokenizer, shutdown_compactions
+from app.services.job_queue import job_queue
+from app.services.message_notifier import message_notifier
+from app.services.response_cache import response_cache
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="AppChat Backend API")
+_import_seconds = time.perf_counter() - _import_started
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Client / engine / executor dùng chung được tạo ở đây (không phải lúc import) và đóng khi tắt
+    startup_report.begin(_import_seconds)
+    with startup_report.step("database"):
+        init_engines()
+    with startup_report.step("llm_client"):
+        open_client()
+    with startup_report.step("storage"):
+        await open_storage()
+    with startup_report.step("tokenizer"):
+        warm_tokenizer()
+    with startup_report.step("csv_pool"):
+        await start_csv_pool()
+    with startup_report.step("job_queue"):
+        await job_queue.start()
+    startup_report.finish()
+    yield
+    await job_queue.stop()
+    await shutdown_csv_pool()
+    await shutdown_hash_pool()
+    await shutdown_compactions()
+    await close_storage()
+    await close_client()
+    await dispose_engines()
 
-app.add_middleware(ErrorLoggingMiddleware)
+register_stats("csv_pool", csv_pool_stats)
+register_stats("hash_pool", hash_pool_stats)
+register_stats("csv_summary_cache", summary_cache.stats)
+register_stats("response_cache", response_cache.stats)
+register_stats("principal_cache", principal_cache.stats)
+register_stats("job_queue", job_queue.stats)
+register_stats("message_notifier", message_notifier.stats)
+register_stats("logging", logging_stats)
+register_stats("startup", startup_report.stats)
 
-app.include_router(auth_router, prefix="/auth", tags=["auth"])
-app.include_router(user_router, prefix="/users", tags=["users"])
-app.include_router(conversation_router, prefix="/conversations", tags=["conversations"])
-app.include_router(file_router, prefix="/files", tags=["files"])
-app.include_router(message_router, prefix="/messages", tags=["messages"])
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
-@app.get("/health")
 def health_check():
-    logger.info("Health check OK")
-    return {"status": "ok"}
\ No newline at end of file
+    logger.info("Health check OK", extra=SAMPLED)
+    return {"status": "ok"}
+
+def create_app() -> FastAPI:
+    # uvicorn app.main:app, hoặc uvicorn --factory app.main:create_app
+    app = FastAPI(title="AppChat Backend API", lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Request-ID", "Server-Timing"],
+    )
+
+    app.add_middleware(ErrorLoggingMiddleware)
+
+    app.include_router(auth_router, prefix="/auth", tags=["auth"])
+    app.include_router(user_router, prefix="/users", tags=["users"])
+    app.include_router(conversation_router, prefix="/conversations", tags=["conversations"])
+    app.include_router(file_router, prefix="/files", tags=["files"])
+    app.include_router(message_router, prefix="/messages", tags=["messages"])
+    app.include_router(job_router, prefix="/jobs", tags=["jobs"])
+
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/health", health_check, methods=["GET"])
+    return app
+
+app = create_app()
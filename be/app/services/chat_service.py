@@ -1,63 +1,143 @@
 import os
-import dotenv
-from openai import AsyncOpenAI
+import asyncio
+from fastapi import HTTPException
 
-from app.services.image_service import ask_about_image
-from app.services.csv_service import ask_about_csv
+from app.services.image_service import ask_about_image, ask_about_image_stream
+from app.services.csv_service import ask_about_csv, ask_about_csv_stream
+from app.services.llm_client import DEFAULT_MODEL
+from app.services.response_cache import cache_scope, cached_chat_completion, cached_stream_chat_completion
+from app.core.metrics import set_filetype
 
-dotenv.load_dotenv()
+CHAT_FILE_CONCURRENCY = int(os.getenv("CHAT_FILE_CONCURRENCY", "4"))
+CHAT_FILE_TIMEOUT = float(os.getenv("CHAT_FILE_TIMEOUT", "60"))
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY must be set in environment variables.")
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+FRIEND_SYSTEM_PROMPT = (
+    "You are a friendly, empathetic chat companion. Speak in a casual, warm tone, as if you were a friend. "
+    "Keep responses concise, helpful, and engaging. Ask follow-up questions when appropriate."
+)
 
 
-async def _chat_like_friend(prompt_text: str) -> str:
-    system_prompt = (
-        "You are a friendly, empathetic chat companion. Speak in a casual, warm tone, as if you were a friend. "
-        "Keep responses concise, helpful, and engaging. Ask follow-up questions when appropriate."
-    )
+def _friend_input(prompt_text: str) -> str:
+    return prompt_text if (prompt_text and prompt_text.strip()) else "Hi!"
 
-    user_text = prompt_text if (prompt_text and prompt_text.strip()) else "Hi!"
 
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_text},
-        ],
-    )
+def _build_friend_messages(prompt_text: str, history: list | None = None) -> list:
+    return [
+        {"role": "system", "content": FRIEND_SYSTEM_PROMPT},
+        *(history or []),
+        {"role": "user", "content": _friend_input(prompt_text)},
+    ]
 
-    if not response.choices:
-        return ""
-    content = getattr(response.choices[0].message, "content", None)
-    return content or ""
 
+async def _chat_like_friend(prompt_text: str, history: list | None = None) -> str:
+    async def build():
+        return _build_friend_messages(prompt_text, history)
 
-async def process_chat_message(content: str, files: list):
+    scope = cache_scope(DEFAULT_MODEL, FRIEND_SYSTEM_PROMPT, history=history)
+    return await cached_chat_completion(build, scope=scope, text=_friend_input(prompt_text))
+
+
+async def _chat_like_friend_stream(prompt_text: str, history: list | None = None):
+    async def build():
+        return _build_friend_messages(prompt_text, history)
+
+    scope = cache_scope(DEFAULT_MODEL, FRIEND_SYSTEM_PROMPT, history=history)
+    async for token in cached_stream_chat_completion(build, scope=scope, text=_friend_input(prompt_text)):
+        yield token
+
+
+async def _analyze_file(f: dict, content: str) -> str:
+    file_type = f.get("type", "").lower()
+    # Chạy trong task riêng của từng file nên không ảnh hưởng các file khác
+    set_filetype(file_type)
+    file_bytes = f.get("bytes")
+    mime = f.get("mime", "application/octet-stream")
+
+    if file_type == "image":
+        return await ask_about_image(file_bytes, content, mime_type=mime, content_hash=f.get("sha256")) #type: ignore
+    elif file_type == "csv":
+        return await ask_about_csv(file_bytes, content, content_hash=f.get("sha256")) #type: ignore
+    return f"Unsupported file type: {file_type}"
+
+
+async def _stream_file(f: dict, content: str):
+    file_type = f.get("type", "").lower()
+    set_filetype(file_type)
+    file_bytes = f.get("bytes")
+    mime = f.get("mime", "application/octet-stream")
+
+    if file_type == "image":
+        async for token in ask_about_image_stream(file_bytes, content, mime_type=mime, content_hash=f.get("sha256")): #type: ignore
+            yield token
+    elif file_type == "csv":
+        async for token in ask_about_csv_stream(file_bytes, content, content_hash=f.get("sha256")): #type: ignore
+            yield token
+    else:
+        yield f"Unsupported file type: {file_type}"
+
+
+async def process_chat_message(content: str, files: list, history: list | None = None):
     if not files:
-        return await _chat_like_friend(content)
+        return await _chat_like_friend(content, history)
 
-    responses = []
+    # Phân tích các file song song, giới hạn số lượng chạy cùng lúc
+    semaphore = asyncio.Semaphore(CHAT_FILE_CONCURRENCY)
 
-    for f in files:
-        file_type = f.get("type", "").lower()
-        file_bytes = f.get("bytes")
-        mime = f.get("mime", "application/octet-stream")
+    async def run(f: dict) -> str:
         filename = f.get("filename", "unknown")
-        
-        try:
-            if file_type == "image":
-                resp = await ask_about_image(file_bytes, content, mime_type=mime)
-            elif file_type == "csv":
-                resp = await ask_about_csv(file_bytes, content)
-            else:
-                resp = f"Unsupported file type: {file_type}"
-        except Exception as e:
-            resp = f"Error processing {filename}: {str(e)}"
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(_analyze_file(f, content), timeout=CHAT_FILE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return f"Timed out processing {filename}"
+            except HTTPException:
+                raise
+            except Exception as e:
+                return f"Error processing {filename}: {str(e)}"
 
-        responses.append(resp)
+    responses = await asyncio.gather(*(run(f) for f in files))
 
     return "\n\n".join(responses)
+
+
+async def stream_chat_message(content: str, files: list, history: list | None = None):
+    if not files:
+        async for token in _chat_like_friend_stream(content, history):
+            yield token
+        return
+
+    # Mỗi file stream vào queue riêng; các file chạy song song nhưng
+    # được trả về theo đúng thứ tự ban đầu
+    semaphore = asyncio.Semaphore(CHAT_FILE_CONCURRENCY)
+    queues = [asyncio.Queue() for _ in files]
+
+    async def produce(f: dict, queue: asyncio.Queue):
+        filename = f.get("filename", "unknown")
+        try:
+            async with semaphore:
+                async with asyncio.timeout(CHAT_FILE_TIMEOUT):
+                    async for token in _stream_file(f, content):
+                        queue.put_nowait(token)
+        except TimeoutError:
+            queue.put_nowait(f"Timed out processing {filename}")
+        except HTTPException as e:
+            # Lỗi có status (vd. 503 khi CSV pool quá tải) được ném lại ở phía đọc, không thành nội dung trả lời
+            queue.put_nowait(e)
+        except Exception as e:
+            queue.put_nowait(f"Error processing {filename}: {str(e)}")
+        finally:
+            queue.put_nowait(None)
+
+    tasks = [asyncio.create_task(produce(f, q)) for f, q in zip(files, queues)]
+    try:
+        for index, queue in enumerate(queues):
+            if index > 0:
+                yield "\n\n"
+            while (token := await queue.get()) is not None:
+                if isinstance(token, HTTPException):
+                    raise token
+                yield token
+    finally:
+        for task in tasks:
+            task.cancel()
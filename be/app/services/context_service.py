@@ -0,0 +1,202 @@
+import os
+import time
+import asyncio
+from typing import NamedTuple
+
+from sqlalchemy import select, tuple_
+
+from app.core.database import AsyncSessionLocal
+from app.core.logging_config import logger
+from app.api.conversation.model import Conversation
+from app.api.message.model import Message
+from app.services.llm_client import DEFAULT_MODEL, chat_completion
+
+# Tổng số token dành cho lịch sử + summary + tin nhắn hiện tại
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Số message gần nhất (chưa được tóm tắt) đọc từ DB cho mỗi request
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "40"))
+# Khi vượt budget, chỉ giữ lại phần mới nhất trong tỉ lệ này; phần cũ hơn được gộp vào summary,
+# để không phải gọi LLM tóm tắt ở mỗi lượt chat
+CONTEXT_KEEP_RATIO = float(os.getenv("CONTEXT_KEEP_RATIO", "0.5"))
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "40"))
+CONTEXT_SUMMARY_WORDS = int(os.getenv("CONTEXT_SUMMARY_WORDS", "200"))
+
+# Token phụ cho mỗi message (role, phân cách) theo định dạng chat của OpenAI
+MESSAGE_TOKEN_OVERHEAD = 4
+# Load tokenizer lỗi (vd. không tải được file BPE) thì thử lại sau khoảng này
+TOKENIZER_RETRY_INTERVAL = float(os.getenv("TOKENIZER_RETRY_INTERVAL", "300"))
+
+_encoder = None
+_encoder_task: asyncio.Task | None = None
+_encoder_retry_at = 0.0
+_tiktoken_missing = False
+
+_compactions: dict[str, asyncio.Task] = {}
+
+
+class ChatContext(NamedTuple):
+    messages: list
+    # Key (created_at, id) của message mới nhất cần gộp vào summary, None nếu chưa cần
+    compact_up_to: tuple | None
+
+
+def _load_encoder():
+    # Lần đầu tiktoken có thể tải file BPE qua mạng: chạy trong thread, không trên event loop
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(DEFAULT_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+async def _load_tokenizer():
+    global _encoder, _encoder_retry_at, _tiktoken_missing
+    try:
+        _encoder = await asyncio.to_thread(_load_encoder)
+        logger.info("Tokenizer loaded for model %s", DEFAULT_MODEL)
+    except ImportError as e:
+        _tiktoken_missing = True
+        logger.warning("tiktoken is not installed, estimating token counts: %r", e)
+    except Exception as e:
+        _encoder_retry_at = time.monotonic() + TOKENIZER_RETRY_INTERVAL
+        logger.warning("Tokenizer unavailable, estimating token counts (retry in %.0fs): %r", TOKENIZER_RETRY_INTERVAL, e)
+
+
+def warm_tokenizer():
+    # Gọi lúc startup và ở mỗi build_context: load ở background nếu chưa có (chỉ coi là xong khi load thành công);
+    # trong lúc chờ count_tokens ước lượng ~4 ký tự / token
+    global _encoder_task
+    if _encoder is not None or _tiktoken_missing or time.monotonic() < _encoder_retry_at:
+        return
+    if _encoder_task is None or _encoder_task.done():
+        _encoder_task = asyncio.create_task(_load_tokenizer())
+
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+async def build_context(db, conversation, prompt_text: str) -> ChatContext:
+    warm_tokenizer()
+
+    # Lấy các message chưa được tóm tắt, mới nhất trước
+    query = select(Message.id, Message.content, Message.sender, Message.created_at).where(
+        Message.conversation_id == conversation.id
+    )
+    if conversation.summary_until_at is not None:
+        query = query.where(
+            tuple_(Message.created_at, Message.id) > (conversation.summary_until_at, conversation.summary_until_id)
+        )
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(CONTEXT_MAX_MESSAGES)
+    rows = (await db.execute(query)).all()
+
+    budget = CONTEXT_TOKEN_BUDGET - count_tokens(prompt_text or "") - MESSAGE_TOKEN_OVERHEAD
+    if conversation.summary:
+        budget -= count_tokens(conversation.summary) + MESSAGE_TOKEN_OVERHEAD
+    keep_budget = budget * CONTEXT_KEEP_RATIO
+
+    history = []
+    used = 0
+    keep_index = None
+    for index, row in enumerate(rows):
+        tokens = count_tokens(row.content) + MESSAGE_TOKEN_OVERHEAD
+        if keep_index is None and used + tokens > keep_budget:
+            keep_index = index
+        if used + tokens > budget:
+            break
+        used += tokens
+        history.append({"role": "user" if row.sender == "user" else "assistant", "content": row.content})
+    else:
+        if len(rows) < CONTEXT_MAX_MESSAGES:
+            # Toàn bộ lịch sử chưa tóm tắt đều vừa budget
+            keep_index = None
+        elif keep_index is None:
+            # Còn message cũ hơn giới hạn đọc: gộp dần vào summary
+            keep_index = len(rows) - 1
+
+    history.reverse()
+    if conversation.summary:
+        history.insert(0, _summary_message(conversation.summary))
+
+    compact_up_to = None
+    if keep_index is not None and keep_index < len(rows):
+        row = rows[keep_index]
+        compact_up_to = (row.created_at, row.id)
+    return ChatContext(messages=history, compact_up_to=compact_up_to)
+
+
+def _summary_prompt(summary: str | None, rows) -> list:
+    transcript = "\n".join(f"{'User' if row.sender == 'user' else 'Assistant'}: {row.content}" for row in rows)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a chat between a user and an assistant. "
+                "Merge the new messages into the existing summary. Keep facts, names, preferences, "
+                f"decisions and open questions; drop small talk. Answer with the updated summary only, "
+                f"at most {CONTEXT_SUMMARY_WORDS} words."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+        },
+    ]
+
+
+async def _compact(conversation_id, up_to: tuple):
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        if conversation is None:
+            return
+
+        key = tuple_(Message.created_at, Message.id)
+        query = select(Message.id, Message.content, Message.sender, Message.created_at).where(
+            Message.conversation_id == conversation_id, key <= up_to
+        )
+        if conversation.summary_until_at is not None:
+            query = query.where(key > (conversation.summary_until_at, conversation.summary_until_id))
+        query = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(CONTEXT_SUMMARY_BATCH)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            return
+
+        summary = await chat_completion(_summary_prompt(conversation.summary, rows))  # type: ignore
+        conversation.summary = summary.strip()  # type: ignore
+        conversation.summary_until_at = rows[-1].created_at
+        conversation.summary_until_id = rows[-1].id
+        await db.commit()
+        logger.info("Compacted %s messages into summary for conversation id=%s", len(rows), conversation_id)
+
+
+def schedule_compaction(conversation_id, up_to: tuple | None):
+    # Gộp message cũ vào summary ở background, tối đa một task cho mỗi conversation
+    if up_to is None:
+        return
+    key = str(conversation_id)
+    if key in _compactions:
+        return
+
+    async def run():
+        try:
+            await _compact(conversation_id, up_to)
+        except Exception as e:
+            logger.error("Summary compaction failed for conversation id=%s: %r", conversation_id, e)
+        finally:
+            _compactions.pop(key, None)
+
+    _compactions[key] = asyncio.create_task(run())
+
+
+async def shutdown_compactions():
+    tasks = list(_compactions.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
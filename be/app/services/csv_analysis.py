@@ -0,0 +1,117 @@
+import io
+import os
+import codecs
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Các hàm ở đây chạy trong process pool (xem csv_pool.py),
+# không import thêm module nào của app để worker khởi động nhanh.
+# pandas / charset_normalizer import trong hàm: process chính chỉ tham chiếu các hàm này
+# để gửi sang worker, không cần load pandas
+
+CSV_SUMMARY_ROWS = 1000
+CSV_CHUNK_ROWS = 500
+CSV_COUNT_CHUNK_ROWS = 50_000
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+def detect_encoding(file_bytes: bytes) -> str:
+    # Đoán encoding một lần từ phần đầu file thay vì thử đọc lại cả file nhiều lần
+    prefix = bytes(memoryview(file_bytes)[:ENCODING_SNIFF_BYTES])
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    from charset_normalizer import from_bytes
+
+    best = from_bytes(prefix).best()
+    return best.encoding if best else "latin1"
+
+def _read_csv_chunks(file_bytes: bytes, encoding: str, chunksize: int, **kwargs):
+    # encoding_errors="replace": byte lỗi ở cuối file không làm phải parse lại từ đầu
+    import pandas as pd
+
+    return pd.read_csv(
+        io.BytesIO(file_bytes),
+        encoding=encoding,
+        encoding_errors="replace",
+        chunksize=chunksize,
+        **kwargs,
+    )
+
+def _read_summary_frame(file_bytes: bytes, encoding: str) -> "pd.DataFrame":
+    # Chỉ đọc đủ số dòng cần cho phần tóm tắt, không load cả file vào DataFrame
+    import pandas as pd
+
+    frames = []
+    rows = 0
+    with _read_csv_chunks(file_bytes, encoding, CSV_CHUNK_ROWS) as reader:
+        for chunk in reader:
+            chunk = chunk.dropna(how="all")
+            frames.append(chunk)
+            rows += len(chunk)
+            if rows >= CSV_SUMMARY_ROWS:
+                break
+
+    if not frames:
+        return pd.read_csv(io.BytesIO(file_bytes), encoding=encoding, encoding_errors="replace", nrows=0)
+    return pd.concat(frames, ignore_index=True).head(CSV_SUMMARY_ROWS)
+
+def csv_metadata(file_bytes: bytes) -> dict:
+    import pandas as pd
+
+    encoding = detect_encoding(file_bytes)
+    columns = pd.read_csv(io.BytesIO(file_bytes), encoding=encoding, encoding_errors="replace", nrows=0).columns
+
+    # Đếm số dòng theo từng chunk, chỉ parse cột đầu tiên
+    rows = 0
+    if len(columns):
+        with _read_csv_chunks(file_bytes, encoding, CSV_COUNT_CHUNK_ROWS, usecols=[0]) as reader:
+            for chunk in reader:
+                rows += len(chunk)
+
+    return {
+        "rows": rows,
+        "columns": len(columns),
+        "column_names": columns.tolist()
+    }
+
+def summarize_csv(file_bytes: bytes) -> str:
+    import pandas as pd
+
+    df = _read_summary_frame(file_bytes, detect_encoding(file_bytes))
+
+    # Làm sạch & chuẩn hóa
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype(str)
+
+    numeric_summary = df.describe(include='number').to_dict()  # type: ignore
+    categorical_summary = {
+        col: df[col].value_counts().head(5).to_dict()
+        for col in df.select_dtypes(include='object').columns
+    }
+    sample_rows = df.head(5).to_dict(orient="records")
+
+    summary_text = (
+        f"Dataset Overview:\n"
+        f"- Rows: {len(df)}, Columns: {len(df.columns)}\n"
+        f"- Columns: {', '.join(df.columns)}\n"
+        f"- Missing values per column: {df.isnull().sum().to_dict()}\n\n"
+        f"Numeric summary: {numeric_summary}\n\n"
+        f"Categorical summary (top 5 values per column): {categorical_summary}\n\n"
+        f"Sample rows:\n{sample_rows}"
+    )
+
+    return summary_text
+
+def warm_up() -> int:
+    # Import sẵn trong worker để request CSV đầu tiên không phải chờ
+    import pandas  # noqa: F401
+    import charset_normalizer  # noqa: F401
+
+    return os.getpid()
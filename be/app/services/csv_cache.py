@@ -0,0 +1,146 @@
+import os
+import asyncio
+from collections import OrderedDict
+
+from app.core.logging_config import logger
+
+CSV_CACHE_MAX_BYTES = int(os.getenv("CSV_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Tầng cache trên đĩa là tùy chọn, chỉ bật khi có CSV_CACHE_DIR
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR")
+CSV_CACHE_DISK_MAX_BYTES = int(os.getenv("CSV_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class SummaryCache:
+    def __init__(self, max_bytes: int, disk_dir: str | None = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._disk_size = 0
+        self._evict_task: asyncio.Task | None = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_size = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.is_file())
+
+    async def get(self, key: str) -> str | None:
+        summary = self._entries.get(key)
+        if summary is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+        # Tầng đĩa đọc trong thread, không chặn event loop
+        if self.disk_dir:
+            summary = await asyncio.to_thread(self._read_disk, key)
+            if summary is not None:
+                self.disk_hits += 1
+                self._put_memory(key, summary)
+                return summary
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, summary: str):
+        self._put_memory(key, summary)
+        if not self.disk_dir:
+            return
+        self._disk_size += await asyncio.to_thread(self._write_disk, key, summary)
+        if self._disk_size > self.disk_max_bytes and (self._evict_task is None or self._evict_task.done()):
+            # Dọn thư mục cache ở background, request không phải chờ scan cả thư mục
+            self._evict_task = asyncio.create_task(self._evict())
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "disk_bytes": self._disk_size,
+        }
+
+    def _put_memory(self, key: str, summary: str):
+        size = len(summary.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key).encode("utf-8"))
+        self._entries[key] = summary
+        self._size += size
+
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.encode("utf-8"))
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.txt")  # type: ignore
+
+    # Các hàm _*_disk chạy trong thread (asyncio.to_thread); số liệu chỉ được cập nhật trên event loop
+
+    def _read_disk(self, key: str) -> str | None:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = f.read()
+            os.utime(path)
+            return summary
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("CSV summary cache read failed for %s: %r", key, e)
+            return None
+
+    def _write_disk(self, key: str, summary: str) -> int:
+        # Trả về số byte đã ghi thêm
+        path = self._disk_path(key)
+        try:
+            if os.path.exists(path):
+                return 0
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(summary)
+            return os.path.getsize(path)
+        except OSError as e:
+            logger.warning("CSV summary cache write failed for %s: %r", key, e)
+            return 0
+
+    def _evict_disk(self, to_free: int) -> tuple[int, int]:
+        # Xóa các file ít được dùng nhất (theo mtime) cho đến khi giải phóng đủ to_free byte.
+        # Trả về (số byte đã xóa, số file đã xóa)
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.is_file()),  # type: ignore
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        freed = removed = 0
+        for entry in entries:
+            if freed >= to_free:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                freed += size
+                removed += 1
+            except OSError:
+                continue
+        return freed, removed
+
+    async def _evict(self):
+        try:
+            freed, removed = await asyncio.to_thread(self._evict_disk, self._disk_size - self.disk_max_bytes)
+        except OSError as e:
+            logger.warning("CSV summary cache eviction failed: %r", e)
+            return
+        self._disk_size -= freed
+        self.evictions += removed
+
+
+summary_cache = SummaryCache(CSV_CACHE_MAX_BYTES, CSV_CACHE_DIR, CSV_CACHE_DISK_MAX_BYTES)
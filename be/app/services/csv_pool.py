@@ -0,0 +1,134 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException, status
+
+from app.core.logging_config import logger
+from app.services.csv_analysis import warm_up
+
+CSV_POOL_WORKERS = int(os.getenv("CSV_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Số task tối đa (đang chạy + đang chờ); vượt quá sẽ trả về 503
+CSV_POOL_MAX_PENDING = int(os.getenv("CSV_POOL_MAX_PENDING", str(CSV_POOL_WORKERS * 4)))
+# Khởi động sẵn worker lúc startup; tắt đi thì worker chỉ được tạo (và tốn RAM) khi có file CSV đầu tiên
+CSV_POOL_PREWARM = os.getenv("CSV_POOL_PREWARM", "true").lower() == "true"
+
+_executor: ProcessPoolExecutor | None = None
+_warm_up_task: asyncio.Task | None = None
+_pending = 0
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "max_queue_depth": 0,
+}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: không fork process đang có thread của event loop / DB pool
+        _executor = ProcessPoolExecutor(
+            max_workers=CSV_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _warm_up():
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        pids = await asyncio.gather(*(loop.run_in_executor(executor, warm_up) for _ in range(CSV_POOL_WORKERS)))
+        logger.info("CSV process pool ready: workers=%s", len(set(pids)))
+    except Exception as e:
+        logger.warning("CSV process pool warm-up failed: %r", e)
+
+
+async def start_csv_pool():
+    # Khởi động các worker (import pandas) ở background: server nhận request ngay,
+    # request CSV đến sớm chỉ chờ worker sẵn sàng
+    global _warm_up_task
+    if CSV_POOL_PREWARM:
+        _warm_up_task = asyncio.create_task(_warm_up())
+
+
+async def shutdown_csv_pool():
+    global _executor, _warm_up_task
+    if _warm_up_task is not None:
+        task, _warm_up_task = _warm_up_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+async def run_csv_task(fn, *args):
+    global _pending
+    if _pending >= CSV_POOL_MAX_PENDING:
+        _stats["rejected"] += 1
+        logger.warning("CSV process pool saturated: pending=%s", _pending)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="CSV analysis is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _pending += 1
+    _stats["submitted"] += 1
+    _stats["max_queue_depth"] = max(_stats["max_queue_depth"], _pending - CSV_POOL_WORKERS)
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException as e:
+        _pending -= 1
+        _stats["failed"] += 1
+        _reset_if_broken(executor, e)
+        raise
+    # Slot chỉ được trả khi worker thực sự xong: request bị hủy (client ngắt kết nối) không hủy được
+    # task đang chạy trong process, nên không giảm _pending ở phía await
+    future.add_done_callback(lambda f: _call_on_loop(loop, _task_done, executor, f))
+    return await asyncio.wrap_future(future)
+
+
+def _call_on_loop(loop, callback, *args):
+    # Callback của concurrent.futures chạy ở thread quản lý của executor
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        # Loop đã đóng (tắt server)
+        pass
+
+
+def _task_done(executor: ProcessPoolExecutor, future):
+    global _pending
+    _pending -= 1
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        _stats["completed"] += 1
+        return
+    _stats["failed"] += 1
+    _reset_if_broken(executor, error)
+
+
+def _reset_if_broken(executor: ProcessPoolExecutor, error: BaseException):
+    global _executor
+    if isinstance(error, BrokenProcessPool) and _executor is executor:
+        # Worker bị chết (OOM, ...): tạo lại pool cho các request sau
+        _executor = None
+
+
+def csv_pool_stats() -> dict:
+    return {
+        "workers": CSV_POOL_WORKERS,
+        "max_pending": CSV_POOL_MAX_PENDING,
+        "in_flight": min(_pending, CSV_POOL_WORKERS),
+        "queue_depth": max(_pending - CSV_POOL_WORKERS, 0),
+        **_stats,
+    }
@@ -1,87 +1,71 @@
-import pandas as pd
-from openai import AsyncOpenAI
-import io, os, dotenv
+import hashlib
 
-dotenv.load_dotenv()
+from app.services.llm_client import DEFAULT_MODEL
+from app.services.response_cache import cache_scope, cached_chat_completion, cached_stream_chat_completion
+from app.services.csv_cache import summary_cache
+from app.services.csv_analysis import summarize_csv
+from app.services.csv_pool import run_csv_task
+from app.core.metrics import stage
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY must be set in environment variables.")
+CSV_SYSTEM_PROMPT = (
+    "You are a professional data analyst. "
+    "You will analyze CSV datasets and answer user questions clearly and accurately."
+)
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def get_csv_summary(file_bytes: bytes, content_hash: str | None = None) -> str:
+    # Cache theo SHA-256 của nội dung file, câu hỏi tiếp theo về cùng file không cần pandas
+    key = content_hash or hashlib.sha256(file_bytes).hexdigest()
+    summary = await summary_cache.get(key)
+    if summary is None:
+        with stage("summarize_csv", "csv"):
+            summary = await run_csv_task(summarize_csv, file_bytes)
+        await summary_cache.put(key, summary)
+    return summary
 
-def summarize_csv(file_bytes: bytes) -> str:
-    encodings_to_try = ["utf-8", "utf-8-sig", "latin1", "iso-8859-1", "windows-1252"]
-    df = None
-    for enc in encodings_to_try:
-        try:
-            df = pd.read_csv(io.BytesIO(file_bytes), encoding=enc)
-            break
-        except UnicodeDecodeError:
-            continue
-    if df is None:
-        raise ValueError("Unable to decode CSV file with common encodings")
+async def _build_csv_messages(file_bytes: bytes, question: str, content_hash: str | None = None) -> list:
+    if not file_bytes:
+        raise ValueError("CSV file is empty")
+    summary = await get_csv_summary(file_bytes, content_hash)
 
-    # Làm sạch & chuẩn hóa
-    df = df.dropna(how="all")
-    df = df.head(1000)
-    for col in df.columns:
-        if pd.api.types.is_datetime64_any_dtype(df[col]):
-            df[col] = df[col].astype(str)
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": CSV_SYSTEM_PROMPT,
+                }
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": (
+                        f"Here is a summary of the CSV dataset:\n\n{summary}\n\n"
+                        f"Now, answer this question:\n{question}"
+                    ),
+                }
+            ],
+        },
+    ]
 
-    numeric_summary = df.describe(include='number').to_dict()  # type: ignore
-    categorical_summary = {
-        col: df[col].value_counts().head(5).to_dict()
-        for col in df.select_dtypes(include='object').columns
-    }
-    sample_rows = df.head(5).to_dict(orient="records")
+def _csv_cache_scope(file_bytes: bytes, content_hash: str | None) -> str:
+    return cache_scope(DEFAULT_MODEL, CSV_SYSTEM_PROMPT, attachment_hash=content_hash or hashlib.sha256(file_bytes).hexdigest())
 
-    summary_text = (
-        f"Dataset Overview:\n"
-        f"- Rows: {len(df)}, Columns: {len(df.columns)}\n"
-        f"- Columns: {', '.join(df.columns)}\n"
-        f"- Missing values per column: {df.isnull().sum().to_dict()}\n\n"
-        f"Numeric summary: {numeric_summary}\n\n"
-        f"Categorical summary (top 5 values per column): {categorical_summary}\n\n"
-        f"Sample rows:\n{sample_rows}"
-    )
+async def ask_about_csv(file_bytes: bytes, question: str, content_hash: str | None = None) -> str:
+    # Trả về kết quả GPT sinh ra
+    async def build():
+        return await _build_csv_messages(file_bytes, question, content_hash)
 
-    return summary_text
+    scope = _csv_cache_scope(file_bytes, content_hash)
+    return await cached_chat_completion(build, scope=scope, text=question)
 
-async def ask_about_csv(file_bytes: bytes, question: str) -> str:
-    if not file_bytes:
-        raise ValueError("CSV file is empty")
-    summary = summarize_csv(file_bytes)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",  # cùng chuẩn với ask_about_image
-        messages=[
-            {
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "You are a professional data analyst. "
-                            "You will analyze CSV datasets and answer user questions clearly and accurately."
-                        ),
-                    }
-                ],
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            f"Here is a summary of the CSV dataset:\n\n{summary}\n\n"
-                            f"Now, answer this question:\n{question}"
-                        ),
-                    }
-                ],
-            },
-        ],
-    ) #type: ignore
+async def ask_about_csv_stream(file_bytes: bytes, question: str, content_hash: str | None = None):
+    async def build():
+        return await _build_csv_messages(file_bytes, question, content_hash)
 
-    # Trả về kết quả GPT sinh ra
-    return response.choices[0].message.content if response.choices else "" #type: ignore
+    scope = _csv_cache_scope(file_bytes, content_hash)
+    async for token in cached_stream_chat_completion(build, scope=scope, text=question):
+        yield token
@@ -0,0 +1,85 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+
+from app.core.logging_config import logger
+
+# bcrypt nhả GIL khi hash nên dùng thread là đủ; pool riêng để login không chiếm threadpool chung của FastAPI
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Số task tối đa (đang chạy + đang chờ); vượt quá sẽ trả về 503
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", str(HASH_POOL_WORKERS * 16)))
+
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "max_queue_depth": 0,
+    "wait_seconds_total": 0.0,
+    "run_seconds_total": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_POOL_WORKERS, thread_name_prefix="hash")
+    return _executor
+
+
+async def shutdown_hash_pool():
+    global _executor
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+def _timed(fn, *args):
+    # Chạy trong thread của pool: chỉ đo, số liệu được cộng trên thread của event loop
+    started_at = time.perf_counter()
+    result = fn(*args)
+    return result, started_at, time.perf_counter() - started_at
+
+
+async def run_hash_task(fn, *args):
+    global _pending
+    if _pending >= HASH_POOL_MAX_PENDING:
+        _stats["rejected"] += 1
+        logger.warning("Password hashing pool saturated: pending=%s", _pending)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _pending += 1
+    _stats["submitted"] += 1
+    _stats["max_queue_depth"] = max(_stats["max_queue_depth"], _pending - HASH_POOL_WORKERS)
+    submitted_at = time.perf_counter()
+    try:
+        result, started_at, run_seconds = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), _timed, fn, *args
+        )
+        _stats["completed"] += 1
+        _stats["wait_seconds_total"] += started_at - submitted_at
+        _stats["run_seconds_total"] += run_seconds
+        return result
+    except Exception:
+        _stats["failed"] += 1
+        raise
+    finally:
+        _pending -= 1
+
+
+def hash_pool_stats() -> dict:
+    return {
+        "workers": HASH_POOL_WORKERS,
+        "max_pending": HASH_POOL_MAX_PENDING,
+        "in_flight": min(_pending, HASH_POOL_WORKERS),
+        "queue_depth": max(_pending - HASH_POOL_WORKERS, 0),
+        **_stats,
+    }
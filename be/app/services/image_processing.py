@@ -0,0 +1,39 @@
+import io
+
+# Mô hình vision (detail=high) thu ảnh về trong 2048x2048 rồi cạnh ngắn 768px: độ phân giải cao hơn là thừa
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_MAX_SHORT_EDGE = 768
+DEFAULT_QUALITY = 85
+
+
+def _target_size(width: int, height: int, max_edge: int, max_short_edge: int) -> tuple[int, int]:
+    scale = min(1.0, max_edge / max(width, height), max_short_edge / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(
+    image_bytes: bytes,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    max_short_edge: int = DEFAULT_MAX_SHORT_EDGE,
+    quality: int = DEFAULT_QUALITY,
+) -> tuple[bytes, str]:
+    # Decode, xoay theo EXIF, thu nhỏ và encode lại (JPEG, hoặc WEBP nếu ảnh có kênh alpha).
+    # Trả về (bytes, mime type)
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", _target_size(image.width, image.height, max_edge, max_short_edge))
+        image = ImageOps.exif_transpose(image)
+
+        size = _target_size(image.width, image.height, max_edge, max_short_edge)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        output = io.BytesIO()
+        if has_alpha:
+            image.convert("RGBA").save(output, format="WEBP", quality=quality, method=4)
+            return output.getvalue(), "image/webp"
+
+        image.convert("RGB").save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return output.getvalue(), "image/jpeg"
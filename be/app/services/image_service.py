@@ -1,41 +1,111 @@
-import base64
 import os
-from openai import AsyncOpenAI
-import dotenv
+import base64
+import hashlib
+import asyncio
+from collections import OrderedDict
+
+from app.core.logging_config import logger
+from app.services.llm_client import DEFAULT_MODEL
+from app.services.response_cache import cache_scope, cached_chat_completion, cached_stream_chat_completion
+from app.services.image_processing import preprocess_image
+from app.core.metrics import stage
+
+# Thu nhỏ + encode lại ảnh trước khi gửi cho LLM
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() == "true"
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+IMAGE_MAX_SHORT_EDGE = int(os.getenv("IMAGE_MAX_SHORT_EDGE", "768"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_PREPROCESS_CONCURRENCY = int(os.getenv("IMAGE_PREPROCESS_CONCURRENCY", str(os.cpu_count() or 1)))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_preprocess_semaphore = asyncio.Semaphore(IMAGE_PREPROCESS_CONCURRENCY)
+# Ảnh đã xử lý, theo SHA-256 của ảnh gốc (LRU giới hạn theo bytes)
+_processed: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+_processed_size = 0
+
+
+def _cache_processed(key: str, value: tuple[bytes, str]):
+    global _processed_size
+    if len(value[0]) > IMAGE_CACHE_MAX_BYTES or key in _processed:
+        return
+    _processed[key] = value
+    _processed_size += len(value[0])
+    while _processed_size > IMAGE_CACHE_MAX_BYTES:
+        _, (evicted, _) = _processed.popitem(last=False)
+        _processed_size -= len(evicted)
+
 
-dotenv.load_dotenv()
+async def prepare_image(image_bytes: bytes, mime_type: str, content_hash: str | None = None) -> tuple[bytes, str]:
+    if not IMAGE_PREPROCESS or not image_bytes:
+        return image_bytes, mime_type
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY must be set in environment variables.")
+    key = content_hash or hashlib.sha256(image_bytes).hexdigest()
+    cached = _processed.get(key)
+    if cached is not None:
+        _processed.move_to_end(key)
+        return cached
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    try:
+        async with _preprocess_semaphore:
+            with stage("image_preprocess", "image"):
+                processed, processed_mime = await asyncio.to_thread(
+                    preprocess_image, image_bytes, IMAGE_MAX_EDGE, IMAGE_MAX_SHORT_EDGE, IMAGE_QUALITY
+                )
+    except Exception as e:
+        # Không decode được (hoặc thiếu Pillow): gửi ảnh gốc như trước
+        logger.warning("Image preprocessing failed, sending original: %r", e)
+        return image_bytes, mime_type
 
-async def ask_about_image(image_bytes: bytes, question: str, mime_type: str = "image/jpeg") -> str:
+    # Ảnh gốc đã nhỏ hơn bản encode lại thì giữ nguyên
+    result = (processed, processed_mime) if len(processed) < len(image_bytes) else (image_bytes, mime_type)
+    _cache_processed(key, result)
+    logger.info("Image preprocessed: %s -> %s bytes (%s)", len(image_bytes), len(result[0]), result[1])
+    return result
+
+
+def _build_image_messages(image_bytes: bytes, question: str, mime_type: str) -> list:
     if not image_bytes:
         raise ValueError("Image bytes are empty")
 
-    base64_image = base64.b64encode(image_bytes).decode("utf-8")
-
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": question,
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{base64_image}"
-                        },
+    # Ghép data URL ở dạng bytes rồi decode một lần, tránh thêm một bản sao chuỗi base64
+    with stage("base64_encode", "image"):
+        data_url = (f"data:{mime_type};base64,".encode("ascii") + base64.b64encode(image_bytes)).decode("ascii")
+
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": question,
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": data_url
                     },
-                ],
-            },
-        ],
-    )
+                },
+            ],
+        },
+    ]
+
+def _image_cache_scope(image_bytes: bytes, mime_type: str, content_hash: str | None) -> str:
+    attachment = f"{mime_type}:{content_hash or hashlib.sha256(image_bytes).hexdigest()}"
+    return cache_scope(DEFAULT_MODEL, "image", attachment_hash=attachment)
+
+async def ask_about_image(image_bytes: bytes, question: str, mime_type: str = "image/jpeg", content_hash: str | None = None) -> str:
+    async def build():
+        data, mime = await prepare_image(image_bytes, mime_type, content_hash)
+        return _build_image_messages(data, question, mime)
+
+    scope = _image_cache_scope(image_bytes, mime_type, content_hash)
+    return await cached_chat_completion(build, scope=scope, text=question)
+
+async def ask_about_image_stream(image_bytes: bytes, question: str, mime_type: str = "image/jpeg", content_hash: str | None = None):
+    async def build():
+        data, mime = await prepare_image(image_bytes, mime_type, content_hash)
+        return _build_image_messages(data, question, mime)
 
-    return response.choices[0].message.content if response.choices else "" #type: ignore
+    scope = _image_cache_scope(image_bytes, mime_type, content_hash)
+    async for token in cached_stream_chat_completion(build, scope=scope, text=question):
+        yield token
@@ -0,0 +1,251 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+from collections import OrderedDict, deque
+
+from app.core.logging_config import logger
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Số job tối đa đang chờ trong queue; vượt quá thì enqueue báo lỗi (router trả 503)
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "1"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "180"))
+# Job đã xong được giữ lại để client lấy kết quả theo job id
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "900"))
+JOB_DEAD_LETTER_MAX = int(os.getenv("JOB_DEAD_LETTER_MAX", "100"))
+# Khi tắt server, chờ các job đang chờ / đang chạy xong trong khoảng này rồi mới hủy
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+DEAD = "dead"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    # payload / result chỉ chứa dữ liệu serialize được (trừ bytes của file đính kèm),
+    # để có thể thay backend in-process bằng Redis mà không đổi handler
+    def __init__(self, kind: str, payload: dict, owner_id=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.payload = payload
+        self.owner_id = owner_id
+        self.status = QUEUED
+        self.attempts = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, DEAD)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "owner_id": self.owner_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobContext:
+    # Handler dùng để đẩy sự kiện (ví dụ từng token) tới các subscriber của job
+    def __init__(self, queue: "JobQueue", job: Job):
+        self.queue = queue
+        self.job = job
+
+    def publish(self, event: str, data):
+        self.queue._publish(self.job, event, data)
+
+
+class JobQueue:
+    def __init__(self, workers: int, max_size: int, max_retries: int, retry_base_delay: float, timeout: float):
+        self.workers = workers
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.timeout = timeout
+
+        self._handlers: dict = {}
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._subscribers: dict[str, set] = {}
+        self._dead_letters: deque = deque(maxlen=JOB_DEAD_LETTER_MAX)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list = []
+        self._running = 0
+        # Chỗ đã giữ trước (reserve) nhưng chưa enqueue
+        self._reserved = 0
+
+        self._stats = {
+            "enqueued": 0,
+            "succeeded": 0,
+            "retried": 0,
+            "dead": 0,
+            "rejected": 0,
+        }
+
+    def register(self, kind: str, handler):
+        # handler: async def handler(ctx: JobContext, payload: dict) -> result (serialize được)
+        self._handlers[kind] = handler
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        logger.info("Job queue started: workers=%s", self.workers)
+
+    async def stop(self):
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=JOB_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Job queue shutdown timed out with %s queued jobs", self._queue.qsize())
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def enqueue(self, kind: str, payload: dict, owner_id=None, reserved: bool = False) -> Job:
+        # reserved=True: dùng chỗ đã giữ bằng reserve()
+        if reserved:
+            self._reserved -= 1
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+
+        self._purge_expired()
+        job = Job(kind, payload, owner_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise QueueFull(f"Job queue is full ({self.max_size})")
+        self._jobs[job.id] = job
+        self._stats["enqueued"] += 1
+        return job
+
+    def has_capacity(self) -> bool:
+        return self._queue is not None and self._queue.qsize() + self._reserved < self.max_size
+
+    def reserve(self) -> bool:
+        # Giữ một chỗ trong queue trước các bước await (lưu tin nhắn, upload) của request,
+        # để các request chạy song song không cùng vượt qua kiểm tra rồi enqueue thất bại
+        if not self.has_capacity():
+            self._stats["rejected"] += 1
+            return False
+        self._reserved += 1
+        return True
+
+    def release(self):
+        # Trả lại chỗ đã giữ khi request lỗi trước lúc enqueue
+        self._reserved -= 1
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        # Nhận (event, data) của job; subscriber phải gọi unsubscribe khi xong
+        events: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(events)
+        return events
+
+    def unsubscribe(self, job_id: str, events: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(events)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def dead_letters(self) -> list:
+        return [job.to_dict() for job in self._dead_letters]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "reserved": self._reserved,
+            "tracked_jobs": len(self._jobs),
+            "dead_letters": len(self._dead_letters),
+            **self._stats,
+        }
+
+    def _publish(self, job: Job, event: str, data):
+        for events in self._subscribers.get(job.id, ()):
+            events.put_nowait((event, data))
+
+    def _set_status(self, job: Job, status: str):
+        job.status = status
+        job.updated_at = time.time()
+        self._publish(job, "status", job.to_dict())
+
+    def _purge_expired(self):
+        now = time.time()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done or job.finished_at is None or now - job.finished_at < JOB_RESULT_TTL:
+                break
+            self._jobs.popitem(last=False)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()  # type: ignore
+            self._running += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+                self._queue.task_done()  # type: ignore
+
+    async def _run(self, job: Job):
+        handler = self._handlers[job.kind]
+        while True:
+            job.attempts += 1
+            self._set_status(job, RUNNING)
+            try:
+                job.result = await asyncio.wait_for(handler(JobContext(self, job), job.payload), timeout=self.timeout)
+                job.error = None
+                job.finished_at = time.time()
+                # Không giữ payload (có thể chứa bytes của file) sau khi xong
+                job.payload = {}
+                self._stats["succeeded"] += 1
+                self._set_status(job, SUCCEEDED)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = repr(e) if not isinstance(e, asyncio.TimeoutError) else "Timed out"
+                if job.attempts > self.max_retries:
+                    logger.error("Job %s id=%s moved to dead letters after %s attempts: %s", job.kind, job.id, job.attempts, job.error)
+                    job.finished_at = time.time()
+                    job.payload = {}
+                    self._dead_letters.append(job)
+                    self._stats["dead"] += 1
+                    self._set_status(job, DEAD)
+                    return
+
+                delay = random.uniform(0, self.retry_base_delay * (2 ** (job.attempts - 1)))
+                logger.warning("Job %s id=%s failed (%s), retry %s/%s in %.2fs", job.kind, job.id, job.error, job.attempts, self.max_retries, delay)
+                self._stats["retried"] += 1
+                self._publish(job, "retry", {"attempt": job.attempts, "error": job.error})
+                await asyncio.sleep(delay)
+
+
+job_queue = JobQueue(JOB_WORKERS, JOB_QUEUE_MAX_SIZE, JOB_MAX_RETRIES, JOB_RETRY_BASE_DELAY, JOB_TIMEOUT)
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import random
+
+from app.core.logging_config import logger
+from app.core.metrics import stage, observe_stage, count_tokens
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# "openai" gọi API thật, "stub" trả lời giả lập (dùng cho load test, không cần mạng)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+
+# Connection pool dùng chung cho mọi service
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+# Deadline cho cả một lần gọi (tính cả các lần retry)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.2"))
+LLM_STUB_TOKEN_DELAY = float(os.getenv("LLM_STUB_TOKEN_DELAY", "0.01"))
+
+# SDK openai (và httpx) chỉ import khi tạo client: backend stub / các script không cần tới
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY must be set in environment variables.")
+
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            http2=LLM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        # Retry do module này tự xử lý (có jitter + deadline), tắt retry của SDK
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+    return _client
+
+
+def open_client():
+    # Gọi lúc startup (lifespan); thiếu API key thì chỉ cảnh báo, lỗi sẽ báo ở request gọi LLM
+    if LLM_BACKEND == "stub":
+        return
+    if not OPENAI_API_KEY:
+        logger.warning("OPENAI_API_KEY is not set, LLM calls will fail")
+        return
+    get_client()
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _backoff_delay(attempt: int) -> float:
+    # Exponential backoff với full jitter
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def _retryable_errors() -> tuple:
+    import openai
+
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+async def _create_with_retry(deadline: float, **kwargs):
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        remaining = deadline - loop.time()
+        try:
+            return await get_client().chat.completions.create(timeout=max(remaining, 0.1), **kwargs)
+        except _retryable_errors() as e:
+            delay = _backoff_delay(attempt)
+            attempt += 1
+            if attempt > LLM_MAX_RETRIES or loop.time() + delay >= deadline:
+                raise
+            logger.warning("LLM call failed (%r), retry %s/%s in %.2fs", e, attempt, LLM_MAX_RETRIES, delay)
+            await asyncio.sleep(delay)
+
+
+def _stub_embedding(text: str, dims: int = 256) -> list:
+    # Vector giả lập từ trigram ký tự: câu gần giống nhau cho vector gần nhau
+    vector = [0.0] * dims
+    padded = f"  {text.lower()} "
+    for i in range(len(padded) - 2):
+        vector[hash(padded[i:i + 3]) % dims] += 1.0
+    return vector
+
+
+def _stub_reply(messages: list) -> str:
+    content = messages[-1].get("content", "") if messages else ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return f"[stub reply] {content[:200]}"
+
+
+def _count_usage(usage):
+    if usage is not None:
+        count_tokens("prompt", usage.prompt_tokens)
+        count_tokens("completion", usage.completion_tokens)
+
+
+async def chat_completion(messages: list, *, model: str = DEFAULT_MODEL, timeout: float | None = None) -> str:
+    if LLM_BACKEND == "stub":
+        with stage("llm"):
+            await asyncio.sleep(LLM_STUB_LATENCY)
+            reply = _stub_reply(messages)
+        count_tokens("completion", len(reply.split()))
+        return reply
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or LLM_TIMEOUT)
+    with stage("llm"):
+        async with asyncio.timeout_at(deadline):
+            response = await _create_with_retry(deadline, model=model, messages=messages)
+    _count_usage(response.usage)
+
+    if not response.choices:
+        return ""
+    return response.choices[0].message.content or ""
+
+
+async def stream_chat_completion(messages: list, *, model: str = DEFAULT_MODEL, timeout: float | None = None):
+    # Đo thời gian tới token đầu tiên (llm_first_token) và tổng thời gian stream (llm)
+    start = time.perf_counter()
+    if LLM_BACKEND == "stub":
+        await asyncio.sleep(LLM_STUB_LATENCY)
+        observe_stage("llm_first_token", time.perf_counter() - start)
+        words = _stub_reply(messages).split(" ")
+        for word in words:
+            await asyncio.sleep(LLM_STUB_TOKEN_DELAY)
+            yield word + " "
+        observe_stage("llm", time.perf_counter() - start)
+        count_tokens("completion", len(words))
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or LLM_TIMEOUT)
+    # Chỉ retry khi chưa nhận được token nào
+    stream = await asyncio.wait_for(
+        _create_with_retry(
+            deadline, model=model, messages=messages, stream=True, stream_options={"include_usage": True}
+        ),
+        timeout=deadline - loop.time(),
+    )
+    chunks = stream.__aiter__()
+    first = True
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(anext(chunks), timeout=deadline - loop.time())
+            except StopAsyncIteration:
+                break
+            # Chunk cuối (không có choices) mang số token của cả lượt
+            _count_usage(getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = getattr(chunk.choices[0].delta, "content", None)
+            if delta:
+                if first:
+                    observe_stage("llm_first_token", time.perf_counter() - start)
+                    first = False
+                yield delta
+    finally:
+        observe_stage("llm", time.perf_counter() - start)
+        await stream.close()
+
+
+async def embed_text(text: str, *, model: str = EMBEDDING_MODEL, timeout: float | None = None) -> list:
+    if LLM_BACKEND == "stub":
+        return _stub_embedding(text)
+
+    response = await asyncio.wait_for(
+        get_client().embeddings.create(model=model, input=text),
+        timeout=timeout or LLM_TIMEOUT,
+    )
+    return response.data[0].embedding
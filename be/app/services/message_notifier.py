@@ -0,0 +1,55 @@
+import asyncio
+from collections import defaultdict
+
+
+class MessageNotifier:
+    # Đánh thức các request long-poll khi conversation có message mới được commit.
+    # Chỉ trong một process (giống job_queue); nhiều worker thì client vẫn nhận được khi hết timeout
+    def __init__(self):
+        self._waiters: defaultdict[str, set] = defaultdict(set)
+        self.notified = 0
+        self.woken = 0
+
+    def subscribe(self, conversation_id) -> asyncio.Future:
+        # Đăng ký trước khi query để không lỡ commit xảy ra giữa query và lúc chờ
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[str(conversation_id)].add(waiter)
+        return waiter
+
+    def unsubscribe(self, conversation_id, waiter: asyncio.Future):
+        key = str(conversation_id)
+        waiters = self._waiters.get(key)
+        if waiters is None:
+            return
+        waiters.discard(waiter)
+        if not waiters:
+            self._waiters.pop(key, None)
+
+    async def wait(self, waiter: asyncio.Future, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self, conversation_id):
+        # Chỉ gọi trên event loop (sau commit ở route / job async): _waiters không có lock
+        waiters = self._waiters.pop(str(conversation_id), None)
+        self.notified += 1
+        if not waiters:
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+                self.woken += 1
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._waiters),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "notified": self.notified,
+            "woken": self.woken,
+        }
+
+
+message_notifier = MessageNotifier()
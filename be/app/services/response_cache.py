@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import json
+import hashlib
+import contextvars
+from collections import OrderedDict
+
+from app.core.logging_config import logger
+from app.services.llm_client import chat_completion, stream_chat_completion, embed_text
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+# Tầng so khớp gần đúng bằng embedding (tốn thêm một lần gọi embedding cho mỗi cache miss)
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Chỉ cache câu hỏi ngắn (chào hỏi, FAQ); câu dài hiếm khi lặp lại
+RESPONSE_CACHE_MAX_INPUT_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_INPUT_CHARS", "500"))
+
+# Tắt cache cho request hiện tại (header Cache-Control, xem app.core.dependencies.response_cache_policy).
+# Job chạy ở background không thấy contextvar của request: giá trị được gửi kèm payload của job
+_cache_enabled = contextvars.ContextVar("response_cache_enabled", default=True)
+
+
+def set_response_cache_enabled(enabled: bool):
+    _cache_enabled.set(enabled)
+
+
+def response_cache_enabled() -> bool:
+    return _cache_enabled.get()
+
+
+def normalize_input(text: str) -> str:
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip(" .!?")
+
+
+def cache_scope(model: str, system_prompt: str, attachment_hash: str | None = None, history: list | None = None) -> str:
+    # Phần cố định của prompt (không tính câu hỏi); câu hỏi chỉ được so khớp trong cùng scope
+    raw = json.dumps([model, system_prompt, attachment_hash, history or []], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, max_entries: int, semantic: bool, similarity: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity = similarity
+
+        # key -> (scope, response, latency gốc, thời điểm hết hạn, embedding)
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._scopes: dict[str, set] = {}
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _key(scope: str, text: str) -> str:
+        return hashlib.sha256(f"{scope}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str):
+        scope = self._entries.pop(key)[0]
+        keys = self._scopes.get(scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._scopes[scope]
+
+    def _get_exact(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[3] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_similar(self, scope: str, embedding: list):
+        import numpy as np
+
+        keys = [key for key in self._scopes.get(scope, ()) if self._entries[key][4] is not None]
+        if not keys:
+            return None
+        matrix = np.array([self._entries[key][4] for key in keys], dtype=np.float32)
+        query = np.array(embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        best = int(scores.argmax())
+        if scores[best] < self.similarity:
+            return None
+        return self._get_exact(keys[best])
+
+    async def lookup(self, scope: str, text: str):
+        # Trả về (response hoặc None, embedding để dùng lại khi store)
+        key = self._key(scope, text)
+        entry = self._get_exact(key)
+        if entry is not None:
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[1], None
+
+        embedding = None
+        if self.semantic:
+            try:
+                embedding = await embed_text(text)
+                entry = self._get_similar(scope, embedding)
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %r", e)
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self.semantic_hits += 1
+                self.saved_seconds += entry[2]
+                return entry[1], embedding
+
+        self.misses += 1
+        return None, embedding
+
+    def store(self, scope: str, text: str, response: str, latency: float, embedding: list | None = None):
+        if not response:
+            return
+        key = self._key(scope, text)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (scope, response, latency, time.monotonic() + self.ttl, embedding)
+        self._scopes.setdefault(scope, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_SEMANTIC, RESPONSE_CACHE_SIMILARITY
+)
+
+
+def _cacheable(text: str) -> bool:
+    if not RESPONSE_CACHE_ENABLED:
+        return False
+    if not _cache_enabled.get() or len(text) > RESPONSE_CACHE_MAX_INPUT_CHARS:
+        response_cache.bypassed += 1
+        return False
+    return True
+
+
+async def cached_chat_completion(build_messages, *, scope: str, text: str) -> str:
+    # build_messages chỉ được gọi khi cache miss (tránh dựng prompt nặng, ví dụ base64 của ảnh)
+    text = normalize_input(text)
+    if not _cacheable(text):
+        return await chat_completion(await build_messages())
+
+    cached, embedding = await response_cache.lookup(scope, text)
+    if cached is not None:
+        return cached
+
+    started_at = time.perf_counter()
+    response = await chat_completion(await build_messages())
+    response_cache.store(scope, text, response, time.perf_counter() - started_at, embedding)
+    return response
+
+
+async def cached_stream_chat_completion(build_messages, *, scope: str, text: str):
+    text = normalize_input(text)
+    if not _cacheable(text):
+        async for token in stream_chat_completion(await build_messages()):
+            yield token
+        return
+
+    cached, embedding = await response_cache.lookup(scope, text)
+    if cached is not None:
+        yield cached
+        return
+
+    started_at = time.perf_counter()
+    parts = []
+    async for token in stream_chat_completion(await build_messages()):
+        parts.append(token)
+        yield token
+    # Chỉ lưu khi stream kết thúc trọn vẹn
+    response_cache.store(scope, text, "".join(parts), time.perf_counter() - started_at, embedding)
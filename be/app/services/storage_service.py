@@ -0,0 +1,108 @@
+import os
+import asyncio
+
+from app.core.logging_config import logger
+
+# "supabase" dùng Supabase Storage, "local" ghi file xuống đĩa (dùng cho test / load test)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+STORAGE_LOCAL_DIR = os.path.abspath(os.getenv("STORAGE_LOCAL_DIR", "storage"))
+STORAGE_LOCAL_BASE_URL = os.getenv("STORAGE_LOCAL_BASE_URL", f"file://{STORAGE_LOCAL_DIR}")
+
+
+class SupabaseStorage:
+    def __init__(self, url: str | None, key: str | None):
+        self.url = url
+        self.key = key
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    async def _get_client(self):
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    if not self.url or not self.key:
+                        raise ValueError("Supabase URL and KEY must be set in environment variables.")
+                    from supabase import acreate_client
+                    self._client = await acreate_client(self.url, self.key)
+        return self._client
+
+    async def open(self):
+        await self._get_client()
+
+    async def upload(self, bucket: str, name: str, content: bytes, content_type: str | None = None) -> str:
+        client = await self._get_client()
+        # Tên file theo nội dung nên có thể ghi đè (upsert) và cache lâu dài
+        file_options = {"upsert": "true", "cache-control": "31536000"}
+        if content_type:
+            file_options["content-type"] = content_type
+        # Upload file lên Supabase
+        await client.storage.from_(bucket).upload(name, content, file_options)  # type: ignore
+        # Lấy public URL
+        return await self.public_url(bucket, name)
+
+    async def public_url(self, bucket: str, name: str) -> str:
+        # Chỉ ghép URL, không gọi mạng: biết trước URL khi file chưa upload xong
+        client = await self._get_client()
+        return await client.storage.from_(bucket).get_public_url(name)
+
+    async def close(self):
+        self._client = None
+
+
+class LocalStorage:
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    async def open(self):
+        pass
+
+    def _write(self, bucket: str, name: str, content: bytes):
+        directory = os.path.join(self.root, bucket)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    async def upload(self, bucket: str, name: str, content: bytes, content_type: str | None = None) -> str:
+        await asyncio.to_thread(self._write, bucket, name, content)
+        return await self.public_url(bucket, name)
+
+    async def public_url(self, bucket: str, name: str) -> str:
+        return f"{self.base_url}/{bucket}/{name}"
+
+    async def close(self):
+        pass
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(STORAGE_LOCAL_DIR, STORAGE_LOCAL_BASE_URL)
+        else:
+            _storage = SupabaseStorage(SUPABASE_URL, SUPABASE_KEY)
+        logger.info("Storage backend: %s", STORAGE_BACKEND)
+    return _storage
+
+
+async def open_storage():
+    # Gọi lúc startup (lifespan); thiếu cấu hình thì chỉ cảnh báo, lỗi sẽ báo ở request upload
+    try:
+        await get_storage().open()
+    except ValueError as e:
+        logger.warning("Storage backend not ready: %s", e)
+
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
@@ -0,0 +1,112 @@
+import json
+import math
+import os
+import platform
+import time
+
+
+def percentile(samples: list, pct: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float) -> dict:
+    # latencies: {operation: [ms, ...]} (chỉ request thành công), errors: {operation: count}
+    operations = {}
+    for name in sorted(set(latencies) | set(errors)):
+        samples = latencies.get(name, [])
+        operations[name] = {
+            "count": len(samples),
+            "errors": errors.get(name, 0),
+            "rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(sum(samples) / len(samples), 2) if samples else None,
+            "p50_ms": _round(percentile(samples, 50)),
+            "p95_ms": _round(percentile(samples, 95)),
+            "p99_ms": _round(percentile(samples, 99)),
+            "max_ms": _round(max(samples) if samples else None),
+        }
+
+    all_samples = [ms for samples in latencies.values() for ms in samples]
+    total = {
+        "count": len(all_samples),
+        "errors": sum(errors.values()),
+        "rps": round(len(all_samples) / elapsed, 2) if elapsed else 0,
+        "p50_ms": _round(percentile(all_samples, 50)),
+        "p95_ms": _round(percentile(all_samples, 95)),
+        "p99_ms": _round(percentile(all_samples, 99)),
+    }
+    return {"elapsed_s": round(elapsed, 2), "total": total, "operations": operations}
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def save_result(result: dict, results_dir: str, label: str | None) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = f"{stamp}-{label}.json" if label else f"{stamp}.json"
+    path = os.path.join(results_dir, name)
+    result = {
+        **result,
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_result(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_report(result: dict) -> str:
+    lines = []
+    header = f"{'operation':<10} {'count':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}"
+    lines.append(header)
+    lines.append("-" * len(header))
+    rows = list(result["operations"].items()) + [("TOTAL", result["total"])]
+    for name, stats in rows:
+        lines.append(
+            f"{name:<10} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+            f"{_fmt(stats['p50_ms']):>9} {_fmt(stats['p95_ms']):>9} {_fmt(stats['p99_ms']):>9}"
+        )
+    startup = result.get("startup")
+    if startup:
+        lines.append(f"startup: ready={_fmt(startup.get('ready_s'))}s idle RSS={_fmt(startup.get('idle_rss_mb'))}MB")
+    rss = result.get("peak_rss_mb")
+    if rss:
+        lines.append(f"peak RSS: server={_fmt(rss.get('server'))}MB workers={_fmt(rss.get('children'))}MB")
+    return "\n".join(lines)
+
+
+def format_comparison(current: dict, baseline: dict, threshold_pct: float) -> tuple[str, bool]:
+    # So với lần chạy trước: p95 / p99 tăng hoặc RPS giảm quá threshold_pct% thì báo regression
+    lines = []
+    if current.get("config") != baseline.get("config"):
+        lines.append("note: baseline was run with a different config, numbers are not directly comparable")
+    lines.append(f"{'operation':<10} {'metric':<7} {'baseline':>10} {'current':>10} {'change':>9}")
+    regressed = False
+    rows = [(name, stats, baseline["operations"].get(name)) for name, stats in current["operations"].items()]
+    rows.append(("TOTAL", current["total"], baseline["total"]))
+    for name, stats, base in rows:
+        if not base:
+            continue
+        for metric, higher_is_worse in (("p95_ms", True), ("p99_ms", True), ("rps", False)):
+            old, new = base.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change > threshold_pct if higher_is_worse else change < -threshold_pct
+            regressed = regressed or worse
+            flag = "  REGRESSION" if worse else ""
+            lines.append(f"{name:<10} {metric:<7} {_fmt(old):>10} {_fmt(new):>10} {change:>+8.1f}%{flag}")
+    return "\n".join(lines), regressed
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
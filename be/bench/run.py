@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+from bench.report import summarize, save_result, load_result, format_report, format_comparison
+from bench.workload import Fixtures, parse_mix, pick_operation, text_prompt, CSV_QUESTIONS, IMAGE_QUESTIONS
+
+BE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BE_DIR, "bench", "results")
+BENCH_PASSWORD = "bench-password"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline load test: chạy app với LLM giả lập, storage trên đĩa và DB local"
+    )
+    parser.add_argument("--users", type=int, default=10, help="số người dùng ảo chạy song song")
+    parser.add_argument("--duration", type=float, default=30, help="thời gian đo (giây)")
+    parser.add_argument("--mix", help="tỉ lệ request, vd. text=60,csv=10,image=10,history=15,login=5")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="độ trễ của LLM giả lập (giây)")
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--database-url", help="mặc định: SQLite trong thư mục tạm; vd. postgresql://u:p@localhost/bench")
+    parser.add_argument("--csv-rows", type=int, default=2000)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--port", type=int, default=0, help="0 = tự chọn port trống")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="biến môi trường thêm cho server (vd. JOB_WORKERS=4), dùng được nhiều lần")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", help="tên ngắn gắn vào file kết quả")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", metavar="RESULT_JSON", help="so sánh với một lần chạy trước")
+    parser.add_argument("--threshold", type=float, default=10, help="%% thay đổi coi là regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server_env(args, workdir: str, database_url: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": str(args.llm_latency),
+        "LLM_STUB_TOKEN_DELAY": str(args.llm_token_delay),
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_DIR": os.path.join(workdir, "storage"),
+        "DATABASE_URL": database_url,
+        "LOG_LEVEL": "WARNING",
+        "LOG_TO_FILE": "false",
+    })
+    env.setdefault("SECRET_KEY", "bench-secret")
+    env.setdefault("OPENAI_API_KEY", "bench")
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    env["PYTHONPATH"] = BE_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def prepare_database(database_url: str, env: dict):
+    # Tạo bảng trong một process riêng để bench không import app (và cấu hình DB của nó)
+    code = (
+        "from sqlalchemy import create_engine\n"
+        "from app.core.database import Base\n"
+        "import app.api.user.model, app.api.conversation.model, app.api.message.model, app.api.file.model\n"
+        "engine = create_engine(%r)\n"
+        "Base.metadata.create_all(engine)\n"
+        "engine.dispose()\n"
+    ) % database_url
+    subprocess.run([sys.executable, "-c", code], cwd=BE_DIR, env=env, check=True)
+
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BE_DIR,
+        env=env,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("Server did not become ready")
+
+
+def stop_server(server: subprocess.Popen):
+    if server.poll() is None:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def _read_status_kb(pid: int, field: str) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _children(pid: int) -> list:
+    pids = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        return []
+    return pids
+
+
+def peak_rss_mb(pid: int) -> dict | None:
+    # VmHWM = RSS cao nhất của process (Linux); worker CSV là process con
+    server = _read_status_kb(pid, "VmHWM")
+    if server is None:
+        return None
+    children = [_read_status_kb(child, "VmHWM") or 0 for child in _children(pid)]
+    return {"server": round(server / 1024, 1), "children": round(sum(children) / 1024, 1)}
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, index: int, run_id: str, fixtures: Fixtures, seed: int):
+        self.client = client
+        self.username = f"bench-{run_id}-{index}"
+        self.fixtures = fixtures
+        self.rng = random.Random(seed + index)
+        self.headers = {}
+        self.conversation_id = None
+        self.seq = 0
+
+    async def setup(self):
+        resp = await self.client.post("/auth/register", json={"username": self.username, "password": BENCH_PASSWORD})
+        resp.raise_for_status()
+        await self.login()
+        resp = await self.client.post("/conversations/", json={"title": f"bench {self.username}"}, headers=self.headers)
+        resp.raise_for_status()
+        self.conversation_id = resp.json()["id"]
+        (await self.send_turn(text_prompt(self.rng, 0))).raise_for_status()
+
+    async def login(self):
+        resp = await self.client.post("/auth/login", data={"username": self.username, "password": BENCH_PASSWORD})
+        resp.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        return resp
+
+    async def send_turn(self, content: str, attachment: tuple | None = None):
+        # multipart giống FE; phần content không có filename nên là field thường
+        files = [("content", (None, content))]
+        if attachment:
+            files.append(("files", attachment))
+        return await self.client.post(
+            f"/conversations/{self.conversation_id}/messages/", files=files, headers=self.headers
+        )
+
+    async def run(self, operation: str):
+        self.seq += 1
+        if operation == "text":
+            return await self.send_turn(text_prompt(self.rng, self.seq))
+        if operation == "csv":
+            return await self.send_turn(self.rng.choice(CSV_QUESTIONS), self.rng.choice(self.fixtures.csvs))
+        if operation == "image":
+            return await self.send_turn(self.rng.choice(IMAGE_QUESTIONS), self.rng.choice(self.fixtures.images))
+        if operation == "history":
+            return await self.client.get(f"/messages/conversation/{self.conversation_id}", headers=self.headers)
+        if operation == "login":
+            return await self.login()
+        raise ValueError(f"Unknown operation: {operation}")
+
+
+async def run_load(args, base_url: str, fixtures: Fixtures, mix: dict) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        run_id = uuid.uuid4().hex[:8]
+        users = [VirtualUser(client, i, run_id, fixtures, args.seed) for i in range(args.users)]
+        await asyncio.gather(*(user.setup() for user in users))
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + args.duration
+
+        async def drive(user: VirtualUser):
+            while loop.time() < deadline:
+                operation = pick_operation(user.rng, mix)
+                t0 = time.perf_counter()
+                try:
+                    resp = await user.run(operation)
+                    ok = resp.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[operation].append((time.perf_counter() - t0) * 1000)
+                else:
+                    errors[operation] += 1
+
+        await asyncio.gather(*(drive(user) for user in users))
+        elapsed = loop.time() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BE_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+    fixtures = Fixtures(args.csv_rows, args.image_size)
+
+    with tempfile.TemporaryDirectory(prefix="chatabb-bench-") as workdir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        env = _server_env(args, workdir, database_url)
+        prepare_database(database_url, env)
+
+        port = args.port or _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        server = start_server(port, env)
+        try:
+            async def ready():
+                async with httpx.AsyncClient(base_url=base_url) as client:
+                    await wait_until_ready(client, server)
+            asyncio.run(ready())
+            # Thời gian từ lúc chạy process tới khi /health trả lời, và RSS lúc chưa có tải
+            startup = {"ready_s": round(time.perf_counter() - started, 2), "idle_rss_mb": None}
+            idle_rss = _read_status_kb(server.pid, "VmRSS")
+            if idle_rss is not None:
+                startup["idle_rss_mb"] = round(idle_rss / 1024, 1)
+
+            summary = asyncio.run(run_load(args, base_url, fixtures, mix))
+            rss = peak_rss_mb(server.pid)
+        finally:
+            stop_server(server)
+
+    result = {
+        "label": args.label,
+        "revision": _git_revision(),
+        "config": {
+            "users": args.users,
+            "duration_s": args.duration,
+            "mix": mix,
+            "llm_latency_s": args.llm_latency,
+            "llm_token_delay_s": args.llm_token_delay,
+            "database": database_url.split(":", 1)[0],
+            "csv_rows": args.csv_rows,
+            "image_size": args.image_size,
+            "server_env": args.server_env,
+        },
+        **summary,
+        "startup": startup,
+        "peak_rss_mb": rss,
+    }
+    path = save_result(result, args.results_dir, args.label)
+    print(format_report(result))
+    print(f"saved: {path}")
+
+    if args.compare:
+        text, regressed = format_comparison(result, load_result(args.compare), args.threshold)
+        print()
+        print(text)
+        if regressed and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import io
+import random
+import struct
+import zlib
+
+# Tỉ lệ mặc định các loại request, gần với cách FE dùng: chủ yếu chat text, thỉnh thoảng gửi file
+DEFAULT_MIX = {
+    "text": 60,
+    "csv": 10,
+    "image": 10,
+    "history": 15,
+    "login": 5,
+}
+
+PROMPTS = [
+    "Hôm nay bạn thế nào?",
+    "Tóm tắt giúp mình cuộc trò chuyện vừa rồi",
+    "Explain the difference between a list and a tuple in Python",
+    "Gợi ý cho mình vài món ăn tối nhanh gọn",
+    "What should I focus on when learning SQL?",
+    "Kể một câu chuyện ngắn về một con mèo",
+    "How do I read a CSV file with pandas?",
+    "Mình nên đi du lịch ở đâu vào tháng mười?",
+]
+
+CSV_QUESTIONS = [
+    "Phân tích dữ liệu này giúp mình",
+    "Which column has the highest average?",
+    "Có giá trị bất thường nào không?",
+]
+
+IMAGE_QUESTIONS = [
+    "Trong ảnh có gì?",
+    "Describe this picture",
+    "Màu chủ đạo của ảnh là gì?",
+]
+
+
+def parse_mix(value: str | None) -> dict:
+    # "text=60,csv=10,..." -> {"text": 60, "csv": 10, ...}
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def make_csv(rows: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    out = io.StringIO()
+    out.write("date,region,product,units,price\n")
+    for i in range(rows):
+        out.write(
+            f"2025-{1 + i % 12:02d}-{1 + i % 28:02d},"
+            f"{rng.choice(['north', 'south', 'east', 'west'])},"
+            f"{rng.choice(['tea', 'coffee', 'juice', 'water'])},"
+            f"{rng.randint(1, 500)},{rng.uniform(0.5, 20):.2f}\n"
+        )
+    return out.getvalue().encode("utf-8")
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def make_png(width: int, height: int, seed: int) -> bytes:
+    # Ảnh RGB nhiễu (khó nén) để gần với ảnh chụp thật; không cần Pillow
+    rng = random.Random(seed)
+    raw = bytearray()
+    for _ in range(height):
+        raw.append(0)
+        raw.extend(rng.getrandbits(8) for _ in range(width * 3))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(bytes(raw), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+class Fixtures:
+    # Một vài file cố định: file trùng nội dung giữa các lượt chat giống thực tế (dedupe / cache)
+    def __init__(self, csv_rows: int, image_size: int, variants: int = 3):
+        self.csvs = [(f"sales-{i}.csv", make_csv(csv_rows, i), "text/csv") for i in range(variants)]
+        self.images = [(f"photo-{i}.png", make_png(image_size, image_size, i), "image/png") for i in range(variants)]
+
+
+def pick_operation(rng: random.Random, mix: dict) -> str:
+    names = list(mix)
+    return rng.choices(names, weights=[mix[name] for name in names])[0]
+
+
+def text_prompt(rng: random.Random, seq: int) -> str:
+    # Thêm số thứ tự để phần lớn prompt không trùng (không đo cache câu trả lời)
+    return f"{rng.choice(PROMPTS)} (#{seq})"
@@ -3,6 +3,10 @@ import conversationsApi from '../services/conversationsApi';
 import messagesApi from '../services/messagesApi';
 import Spinner from './Spinner';
 
+// long-poll: seconds the server may hold one request, and total time to wait for a reply
+const LONG_POLL_WAIT_S = 25;
+const LONG_POLL_TOTAL_MS = 60000;
+
 export default function ChatWindow({ conversationId, userId, onNewConversation }) {
   const [messages, setMessages] = useState([]);
   const [text, setText] = useState('');
@@ -13,22 +17,28 @@ export default function ChatWindow({ conversationId, userId, onNewConversation }
 
   const listRef = useRef(null);
   const lastMessageIdRef = useRef(null);
-  const pendingRetryRef = useRef(null);
-    const stopTimeoutRef = useRef(null);
+  // position of the newest message we have, for /since
+  const latestCursorRef = useRef(null);
+  const pollAbortRef = useRef(null);
+
+  const olderCursorRef = useRef(null);
+  const loadingOlderRef = useRef(false);
+
+  const normalizeMessages = (data) =>
+    data.map((mm) => ({
+      id: mm.id,
+      content: mm.content,
+      sender: mm.sender,
+      created_at: mm.created_at,
+      files: mm.files || [],
+    }));
 
   const fetchAndUpdateMessages = async () => {
         try {
+        // only the latest page; older messages are loaded when scrolling up
         const res = await messagesApi.getByConversationId(conversationId);
-        const data = res?.data || [];
-        const normalized = data
-            .map((mm) => ({
-            id: mm.id,
-            content: mm.content,
-            sender: mm.sender,
-            created_at: mm.created_at,
-            files: mm.files || [],
-            }))
-            .sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
+        const page = res?.data || {};
+        const normalized = normalizeMessages(page.items || []);
 
         const seen = new Set();
         const unique = [];
@@ -42,7 +52,16 @@ export default function ChatWindow({ conversationId, userId, onNewConversation }
 
         const newLastId = unique.length ? unique[unique.length - 1].id : null;
         if (newLastId !== lastMessageIdRef.current || unique.length !== messages.length) {
-            setMessages(unique);
+            setMessages((prev) => {
+            // keep older pages the user already scrolled back to
+            const firstTs = unique.length ? new Date(unique[0].created_at) : null;
+            const older = firstTs
+                ? prev.filter((m) => !seen.has(m.id) && m.created_at && new Date(m.created_at) < firstTs)
+                : [];
+            if (!older.length) olderCursorRef.current = page.has_more ? page.next_cursor : null;
+            return older.concat(unique);
+            });
+            latestCursorRef.current = page.last_cursor || null;
             lastMessageIdRef.current = newLastId;
             requestAnimationFrame(() => {
             if (listRef.current) listRef.current.scrollTop = listRef.current.scrollHeight;
@@ -58,16 +77,86 @@ export default function ChatWindow({ conversationId, userId, onNewConversation }
         }
     };
 
+    const mergeMessages = (prev, incoming) => {
+        // stored copies replace the optimistic ones; the streaming placeholder goes once the reply is stored
+        const byId = new Map(incoming.map((m) => [m.id, m]));
+        const hasReply = incoming.some((m) => m.sender === 'system');
+        const kept = prev
+        .filter((m) => !(hasReply && String(m.id).startsWith('streaming-')))
+        .map((m) => byId.get(m.id) || m);
+        const ids = new Set(kept.map((m) => m.id));
+        return kept.concat(incoming.filter((m) => !ids.has(m.id)));
+    };
+
+    // fetch only messages newer than latestCursorRef; with untilReply, long-poll until the AI reply is stored
+    const syncNewMessages = async ({ untilReply = false } = {}) => {
+        if (!latestCursorRef.current) return fetchAndUpdateMessages();
+        if (pollAbortRef.current) pollAbortRef.current.abort();
+        const controller = new AbortController();
+        pollAbortRef.current = controller;
+        const deadline = Date.now() + LONG_POLL_TOTAL_MS;
+        try {
+        while (true) {
+            const res = await messagesApi.getSince(
+            conversationId,
+            { after: latestCursorRef.current, wait: untilReply ? LONG_POLL_WAIT_S : 0 },
+            controller.signal
+            );
+            const page = res?.data || {};
+            const incoming = normalizeMessages(page.items || []);
+            latestCursorRef.current = page.cursor || latestCursorRef.current;
+            if (incoming.length) {
+            setMessages((prev) => mergeMessages(prev, incoming));
+            lastMessageIdRef.current = incoming[incoming.length - 1].id;
+            requestAnimationFrame(() => {
+                if (listRef.current) listRef.current.scrollTop = listRef.current.scrollHeight;
+            });
+            }
+            if (page.has_more) continue;
+            if (!untilReply || incoming.some((m) => m.sender === 'system') || Date.now() > deadline) break;
+        }
+        } catch (err) {
+        if (!controller.signal.aborted) console.error('Failed to sync messages', err);
+        } finally {
+        if (pollAbortRef.current === controller) pollAbortRef.current = null;
+        }
+    };
+
+    const loadOlderMessages = async () => {
+        if (!olderCursorRef.current || loadingOlderRef.current) return;
+        loadingOlderRef.current = true;
+        try {
+        const res = await messagesApi.getByConversationId(conversationId, { before: olderCursorRef.current });
+        const page = res?.data || {};
+        olderCursorRef.current = page.has_more ? page.next_cursor : null;
+        const older = normalizeMessages(page.items || []);
+        const el = listRef.current;
+        const prevHeight = el ? el.scrollHeight : 0;
+        setMessages((prev) => {
+            const ids = new Set(prev.map((m) => m.id));
+            return older.filter((m) => !ids.has(m.id)).concat(prev);
+        });
+        // keep the viewport on the same message after prepending
+        requestAnimationFrame(() => {
+            if (el) el.scrollTop = el.scrollHeight - prevHeight;
+        });
+        } catch (err) {
+        console.error('Failed to load older messages', err);
+        } finally {
+        loadingOlderRef.current = false;
+        }
+    };
+
     useEffect(() => {
+    olderCursorRef.current = null;
+    lastMessageIdRef.current = null;
+    latestCursorRef.current = null;
+    setMessages([]);
     fetchAndUpdateMessages();
     return () => {
-        if (pendingRetryRef.current) {
-        clearInterval(pendingRetryRef.current);
-        pendingRetryRef.current = null;
-        }
-        if (stopTimeoutRef.current) {
-        clearTimeout(stopTimeoutRef.current);
-        stopTimeoutRef.current = null;
+        if (pollAbortRef.current) {
+        pollAbortRef.current.abort();
+        pollAbortRef.current = null;
         }
     };
     }, [conversationId]);
@@ -130,41 +219,53 @@ export default function ChatWindow({ conversationId, userId, onNewConversation }
     const send = async () => {
         if (!text.trim() && files.length === 0) return;
         setSending(true);
+        const scrollToBottom = () =>
+            requestAnimationFrame(() => {
+            if (listRef.current) listRef.current.scrollTop = listRef.current.scrollHeight;
+            });
+        const streamingId = `streaming-${Date.now()}`;
+        let accepted = false;
+        let replied = false;
         try {
-        await conversationsApi.sendMessage(conversationId, { content: text, files });
-        const updated = await fetchAndUpdateMessages();
-
-        // clear
-        setText('');
-        filePreviews.forEach((u) => u && URL.revokeObjectURL(u));
-        setFilePreviews([]);
-        setFiles([]);
-
-        const newTotal = updated.length;
-            // start a reply poll for 30s, interval 2s, only if total is odd
-            if (pendingRetryRef.current) { clearInterval(pendingRetryRef.current); pendingRetryRef.current = null; }
-            if (stopTimeoutRef.current) { clearTimeout(stopTimeoutRef.current); stopTimeoutRef.current = null; }
-
-            if (newTotal % 2 === 1) {
-                pendingRetryRef.current = setInterval(async () => {
-                try {
-                    const after = await fetchAndUpdateMessages();
-                    // stop if total becomes even or last sender is system
-                    const last = after[after.length - 1];
-                    if ((after.length % 2 === 0) || (last && last.sender === 'system')) {
-                    if (pendingRetryRef.current) { clearInterval(pendingRetryRef.current); pendingRetryRef.current = null; }
-                    if (stopTimeoutRef.current) { clearTimeout(stopTimeoutRef.current); stopTimeoutRef.current = null; }
-                    }
-                } catch (e) { console.error('Reply poll failed', e); }
-                }, 2000);
-
-                stopTimeoutRef.current = setTimeout(() => {
-                if (pendingRetryRef.current) { clearInterval(pendingRetryRef.current); pendingRetryRef.current = null; }
-                stopTimeoutRef.current = null;
-                }, 30000);
+        await conversationsApi.sendMessageStream(
+            conversationId,
+            { content: text, files },
+            {
+            onMessage: (msg) => {
+                accepted = true;
+                // clear input as soon as the server accepted the turn
+                setText('');
+                filePreviews.forEach((u) => u && URL.revokeObjectURL(u));
+                setFilePreviews([]);
+                setFiles([]);
+                setMessages((prev) => {
+                const next = msg ? prev.concat({ ...msg, files: msg.files || [] }) : prev;
+                return next.concat({ id: streamingId, content: '', sender: 'system', created_at: null, files: [] });
+                });
+                scrollToBottom();
+            },
+            onDelta: (chunk) => {
+                setMessages((prev) =>
+                prev.map((m) => (m.id === streamingId ? { ...m, content: m.content + chunk } : m))
+                );
+                scrollToBottom();
+            },
+            onDone: (aiMessage) => {
+                replied = true;
+                setMessages((prev) =>
+                prev.map((m) => (m.id === streamingId ? { ...aiMessage, files: [] } : m))
+                );
+                lastMessageIdRef.current = aiMessage?.id || null;
+            },
             }
+        );
+        // pick up the stored turn (attachments) without re-downloading the history;
+        // if the stream dropped before "done", wait for the reply row in the background
+        if (replied) await syncNewMessages();
+        else syncNewMessages({ untilReply: true });
         } catch (err) {
         console.error('Send failed', err);
+        if (accepted) syncNewMessages({ untilReply: true });
         } finally {
         setSending(false);
         }
@@ -175,7 +276,14 @@ export default function ChatWindow({ conversationId, userId, onNewConversation }
 
     return (
         <div className="bg-[var(--subBg)] rounded-xl shadow p-4 flex flex-col h-[95vh]">
-        <div className="flex-1 overflow-auto mb-4" ref={listRef} style={{ padding: '8px' }}>
+        <div
+            className="flex-1 overflow-auto mb-4"
+            ref={listRef}
+            style={{ padding: '8px' }}
+            onScroll={(e) => {
+            if (e.currentTarget.scrollTop < 40) loadOlderMessages();
+            }}
+        >
             {messages.length === 0 && (
             <div className="text-center text-sm text-[var(--dark2)]">Bắt đầu trò chuyện...</div>
             )}
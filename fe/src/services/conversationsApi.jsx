@@ -3,8 +3,10 @@ import api from "./api";
 const BasePrefix = "/conversations";
 
 const conversationsApi = {
-  getAll: (token) =>
+  // params: { limit, before } — returns { items, has_more, next_cursor }
+  getAll: (params = {}, token) =>
     api.get(`${BasePrefix}/`, {
+      params,
       headers: { Authorization: `Bearer ${token}` },
     }),
 
@@ -42,6 +44,56 @@ const conversationsApi = {
       },
     });
   },
+
+  // Stream AI reply token-by-token (Server-Sent Events)
+  sendMessageStream: async (conversationId, { content, files }, handlers = {}) => {
+    const formData = new FormData();
+    if (content) formData.append("content", content);
+    if (files && files.length > 0) {
+      files.forEach((file) => formData.append("files", file));
+    }
+
+    const token = localStorage.getItem("token");
+    const res = await fetch(
+      `${import.meta.env.VITE_API_URL}${BasePrefix}/${conversationId}/messages/?stream=true`,
+      {
+        method: "POST",
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        body: formData,
+      }
+    );
+    if (!res.ok || !res.body) {
+      throw new Error(`Stream request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+
+        let event = "message";
+        let data = "";
+        raw.split("\n").forEach((line) => {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        });
+        const payload = data ? JSON.parse(data) : {};
+
+        if (event === "message") handlers.onMessage?.(payload.message);
+        else if (event === "delta") handlers.onDelta?.(payload.content);
+        else if (event === "done") handlers.onDone?.(payload.ai_message);
+        else if (event === "error") throw new Error(payload.message);
+      }
+    }
+  },
 };
 
 export default conversationsApi;
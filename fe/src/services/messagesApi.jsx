@@ -3,13 +3,23 @@ import api from "./api";
 const BasePrefix = "/messages";
 
 const messagesApi = {
-  getByConversationId: (conversationId, token) =>
+  // params: { limit, before, after } — returns { items, has_more, next_cursor }
+  getByConversationId: (conversationId, params = {}, token) =>
     api.get(`${BasePrefix}/conversation/${conversationId}`, {
+      params,
       headers: {
         Authorization: `Bearer ${token}`,
       },
     }),
 
+  // params: { after, wait, limit } — only messages after the cursor, returns { items, has_more, cursor }.
+  // wait > 0 keeps the request open (long-poll) until a new message is stored or the wait expires
+  getSince: (conversationId, params = {}, signal) =>
+    api.get(`${BasePrefix}/conversation/${conversationId}/since`, {
+      params,
+      signal,
+    }),
+
   create: (data, token) =>
     api.post(`${BasePrefix}/`, data, {
       headers: {